@@ -1,9 +1,18 @@
-# Import Celery app to ensure it's loaded when Django starts
-try:
-    from .celery import app as celery_app
-    __all__ = ['celery_app']
-except ImportError:
-    # Allow the app to work without Celery
-    import warnings
-    warnings.warn("Celery could not be imported - async tasks will not be available")
-    __all__ = []
+# The Celery app is only loaded when something asks for it (a worker started
+# with `celery -A mysite`, or a task being queued), so web processes don't
+# pay for importing Celery and kombu on every cold start.
+__all__ = ['celery_app']
+
+
+def __getattr__(name):
+    if name == 'celery_app':
+        try:
+            from .celery import app as celery_app
+        except ImportError:
+            # Allow the app to work without Celery
+            import warnings
+            warnings.warn("Celery could not be imported - async tasks will not be available")
+            raise AttributeError(name)
+        globals()['celery_app'] = celery_app
+        return celery_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
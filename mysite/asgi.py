@@ -2,6 +2,8 @@
 ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Live results (polls/<id>/results/events/) hold connections open and are only
+streamed when served from here, e.g. ``uvicorn mysite.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -12,5 +14,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Serve the read-heavy views from polls/async_views.py
+os.environ.setdefault('POLLS_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 import dotenv
 
 # Only load .env.local if the file exists (won't exist on Vercel)
@@ -179,6 +180,21 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Keyset pagination of the API lists (polls.pagination); clients pick a page
+# size with ?page_size= up to MAX_PAGE_SIZE
+POLLS_API_PAGINATION = {
+    'PAGE_SIZE': int(os.environ.get('POLLS_API_PAGE_SIZE', 20)),
+    'MAX_PAGE_SIZE': 100,
+}
+
+# Route the read-heavy pages and question API reads to polls.async_views;
+# mysite/asgi.py turns this on unless the environment says otherwise
+POLLS_ASYNC_VIEWS = os.environ.get('POLLS_ASYNC_VIEWS', 'False') == 'True'
+
+# Serve the question and response lists from values() rows instead of model
+# serializers (polls.fast_serializers); the output is the same
+POLLS_API_FAST_SERIALIZATION = os.environ.get('POLLS_API_FAST_SERIALIZATION', 'False') == 'True'
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -186,16 +202,152 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # Cache settings
-CACHES = {
-    'default': {
+# Shared cache tier: 'locmem' (single process, the default) or 'redis', the
+# only choice for more than one worker process: vote counters, version bumps,
+# rate limits and locks need add() and incr() to be atomic across processes.
+# Each process keeps a small local LRU of versioned entries in front of it;
+# see polls/cache_backends.py
+POLLS_CACHE_BACKEND = os.environ.get('POLLS_CACHE_BACKEND', 'locmem')
+SHARED_CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-polls',
-    }
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('POLLS_CACHE_LOCATION', 'redis://localhost:6379/1'),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'polls.cache_backends.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            # Keys whose content never changes under the same name (versioned)
+            # or that may be a few seconds stale
+            'L1_PREFIXES': ['results:', 'index:'],
+            'L1_MAX_ENTRIES': int(os.environ.get('POLLS_L1_CACHE_MAX_ENTRIES', 1000)),
+            'L1_TIMEOUT': 5,
+        },
+    },
+    'shared': SHARED_CACHE_BACKENDS[POLLS_CACHE_BACKEND],
+    # Buffered vote deltas (polls.vote_buffer) must never be culled: Redis when
+    # that is the shared tier, otherwise a per-process LocMemCache with no
+    # entry limit. See "Buffered votes" in README.md for what can still be lost.
+    'vote_buffer': (
+        dict(SHARED_CACHE_BACKENDS['redis'], KEY_PREFIX='vote_buffer')
+        if POLLS_CACHE_BACKEND == 'redis' else {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'vote-buffer',
+            'TIMEOUT': None,
+            'OPTIONS': {'MAX_ENTRIES': sys.maxsize},
+        }
+    ),
+    # Rendered result charts, shared with Celery workers when the shared tier
+    # is Redis; LocMemCache evicts least recently used entries once
+    # MAX_ENTRIES is reached
+    'charts': (
+        dict(SHARED_CACHE_BACKENDS['redis'], KEY_PREFIX='charts')
+        if POLLS_CACHE_BACKEND == 'redis' else {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'results-charts',
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.environ.get('POLLS_CHART_CACHE_MAX_ENTRIES', 200)),
+            },
+        }
+    ),
+}
+POLLS_CHART_CACHE_MAX_BYTES = 256 * 1024  # larger charts are rendered but not cached
+
+# Chart backend per output format: 'svg' is the dependency-free renderer,
+# 'matplotlib' needs matplotlib and numpy installed
+POLLS_CHART_BACKENDS = {
+    'svg': os.environ.get('POLLS_SVG_CHART_BACKEND', 'svg'),
+    'png': 'matplotlib',
+}
+
+# Chart rendering happens off the request thread: 'process' uses a local
+# process pool, 'celery' a worker (needs POLLS_CACHE_BACKEND=redis), 'inline'
+# neither
+POLLS_CHART_RENDERER = {
+    'MODE': os.environ.get('POLLS_CHART_RENDERER', 'process'),
+    'WORKERS': int(os.environ.get('POLLS_CHART_WORKERS', 2)),
+    'MAX_PENDING': 16,  # jobs queued before charts are skipped
+    'PENDING_TIMEOUT': 60,  # seconds before a lost Celery render is queued again
+}
+
+# Read-through caches (polls.read_cache): BETA > 1 refreshes hot entries
+# earlier, WAIT is how long a request waits for another worker's recompute
+POLLS_READ_CACHE = {
+    'BETA': 1.0,
+    'LOCK_TIMEOUT': 10,
+    'WAIT': 2,
+}
+
+# Live results over Server-Sent Events (polls.live, ASGI only): updates per
+# second per question, seconds between keepalives on idle connections, and
+# the client's reconnection delay in milliseconds
+POLLS_LIVE = {
+    'MAX_RATE': int(os.environ.get('POLLS_LIVE_MAX_RATE', 2)),
+    'KEEPALIVE': 15,
+    'RETRY': 3000,
+}
+
+# Response exports (polls.exports): rows fetched per query, and where the
+# export_poll_data task writes its files
+POLLS_EXPORT = {
+    'CHUNK_SIZE': 2000,
+    'DIRECTORY': os.environ.get('POLLS_EXPORT_DIRECTORY', str(BASE_DIR / 'exports')),
+}
+
+# Upper bound for importing mysite.wsgi in a fresh interpreter, checked by
+# the test suite; `manage.py profile_startup` shows where the time goes
+POLLS_IMPORT_BUDGET = {
+    'SECONDS': float(os.environ.get('POLLS_IMPORT_BUDGET_SECONDS', 2.0)),
+    'MODULES': int(os.environ.get('POLLS_IMPORT_BUDGET_MODULES', 900)),
 }
 
 # Celery settings - disable on Vercel
 CELERY_TASK_ALWAYS_EAGER = True if os.environ.get('VERCEL_DEPLOYMENT') == 'true' else False
 
+# Vote ingestion: 'direct' updates Choice.votes in the request, 'buffered'
+# collects increments in the cache and flushes them to the database in batches,
+# 'events' only appends to the vote event log and leaves counting to compaction
+POLLS_VOTE_INGESTION = os.environ.get('POLLS_VOTE_INGESTION', 'direct')
+POLLS_VOTE_BUFFER = {
+    'FLUSH_THRESHOLD': int(os.environ.get('POLLS_VOTE_BUFFER_FLUSH_THRESHOLD', 100)),  # pending deltas
+    'FLUSH_INTERVAL': int(os.environ.get('POLLS_VOTE_BUFFER_FLUSH_INTERVAL', 10)),  # seconds
+    'JOURNAL_GRACE': 30,  # seconds before an empty journal slot is given up on
+}
+POLLS_VOTE_EVENTS = {
+    'CHUNK_SIZE': 1000,  # events per compaction transaction
+    'SETTLE_SECONDS': 5,  # leave recent events for the next run
+}
+# Stored responses for retried API writes sent with an Idempotency-Key header
+POLLS_IDEMPOTENCY = {
+    'TTL': 60 * 60 * 24,  # how long a key can be replayed
+    'LOCK_TIMEOUT': 30,  # seconds a duplicate may be blocked by the first request
+    'WAIT': 5,  # seconds a duplicate waits for the first result before giving up
+}
+# Token bucket rates per write scope ('<tokens>/<s|m|h|d>'); the web and API
+# vote paths share the 'vote' bucket
+POLLS_RATE_LIMITS = {
+    'vote': os.environ.get('POLLS_VOTE_RATE', '30/m'),
+    'vote_batch': os.environ.get('POLLS_VOTE_BATCH_RATE', '10/m'),
+}
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-vote-buffer': {
+        'task': 'polls.tasks.flush_vote_buffer',
+        'schedule': POLLS_VOTE_BUFFER['FLUSH_INTERVAL'],
+    },
+    'compact-vote-events': {
+        'task': 'polls.tasks.compact_vote_events',
+        'schedule': 30.0,
+    },
+}
+
 # Logging - simplified for Vercel
 LOGGING = {
     'version': 1,
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.db.models import Count
 from django.utils.html import format_html
-from .models import Question, Choice, UserResponse, QuestionAnalytics, QuestionWithMetadata, POSTGRES_AVAILABLE
+from .models import Question, Choice, UserResponse, QuestionAnalytics, QuestionWithMetadata, VoteEvent, POSTGRES_AVAILABLE
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
@@ -62,6 +62,16 @@ class QuestionAnalyticsAdmin(admin.ModelAdmin):
     search_fields = ["question__question_text"]
     readonly_fields = ["total_votes", "last_vote_date"]
 
+class VoteEventAdmin(admin.ModelAdmin):
+    list_display = ["event_date", "user", "question", "choice", "previous_choice", "deferred"]
+    list_filter = ["event_date", "deferred"]
+    search_fields = ["user__username", "question__question_text"]
+    list_select_related = ["user", "question", "choice", "previous_choice"]
+    
+    # The event log is append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
 class QuestionWithMetadataAdmin(admin.ModelAdmin):
     list_display = ["question", "display_tags"]
     search_fields = ["question__question_text"]
@@ -78,3 +88,4 @@ admin.site.register(Choice)
 admin.site.register(UserResponse, UserResponseAdmin)
 admin.site.register(QuestionAnalytics, QuestionAnalyticsAdmin)
 admin.site.register(QuestionWithMetadata, QuestionWithMetadataAdmin)
+admin.site.register(VoteEvent, VoteEventAdmin)
@@ -1,8 +1,7 @@
-from rest_framework import viewsets, permissions, status, filters
+from rest_framework import viewsets, permissions, serializers, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 from django.utils import timezone
 
 from .models import Question, Choice, UserResponse, QuestionAnalytics
@@ -11,8 +10,14 @@ from .serializers import (
     ChoiceSerializer, 
     UserResponseSerializer,
     QuestionAnalyticsSerializer,
-    UserSerializer
+    UserSerializer,
+    VoteBatchSerializer,
+    VoteSerializer
 )
+from . import cache_versions, conditional, fast_serializers, services
+from .idempotency import idempotent
+from .pagination import ChoicePagination, QuestionPagination, UserResponsePagination
+from .ratelimit import TokenBucketThrottle
 
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
@@ -29,16 +34,108 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
         return obj.author == request.user
 
 
-class QuestionViewSet(viewsets.ModelViewSet):
+class SparseFieldsetMixin:
+    """
+    Loads only what the serializer will output: columns of the requested
+    fields with only() on reads, joins for dotted sources, and prefetches for
+    nested serializers that were expanded
+    """
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer = self.get_serializer()
+        columns = {'pk'}
+        select = set()
+        prefetch = set()
+        for field in serializer.fields.values():
+            if field.source == '*':
+                return queryset
+            path = field.source.replace('.', '__')
+            if isinstance(field, serializers.BaseSerializer):
+                prefetch.add(path)
+            else:
+                columns.add(path)
+                if '__' in path:
+                    select.add(path.rsplit('__', 1)[0])
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if self.request.method in permissions.SAFE_METHODS:
+            get_ordering = getattr(self.paginator, 'get_ordering', None)
+            if get_ordering is not None:
+                # The paginator reads the ordering fields of every row
+                columns.update(field.lstrip('-') for field in get_ordering(self.request, queryset, self))
+            queryset = queryset.only(*columns)
+        return queryset
+
+
+class FastListMixin:
+    """
+    Serves list with fast_serializer_class when POLLS_API_FAST_SERIALIZATION
+    is on: rows come from values() instead of model instances, with the same
+    output as serializer_class
+    """
+    fast_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not fast_serializers.is_enabled():
+            return super().list(request, *args, **kwargs)
+        fast_serializer = self.fast_serializer_class(self.get_serializer())
+        queryset = self.filter_queryset(self.get_queryset())
+        extra = ()
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        if get_ordering is not None:
+            # The paginator reads the ordering fields of every row
+            extra = [field.lstrip('-') for field in get_ordering(request, queryset, self)]
+        rows = fast_serializer.values(queryset, extra)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast_serializer.to_representation(page))
+        return Response(fast_serializer.to_representation(rows))
+
+
+class ConditionalGetMixin:
+    """
+    ETag (and, where cheap, Last-Modified) validation for list and retrieve,
+    checked against cache versions before the queryset is evaluated
+    """
+    def get_validators(self, request, *args, **kwargs):
+        """Return (etag, last_modified or None), or None to skip validation"""
+        return None
+    
+    def _conditional(self, view_method, request, *args, **kwargs):
+        validators = self.get_validators(request, *args, **kwargs)
+        if validators is None:
+            return view_method(request, *args, **kwargs)
+        etag, last_modified = validators
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            response = view_method(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        # Browsable API pages show the logged in user
+        return conditional.set_validators(response, etag, last_modified, private=True)
+    
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
+
+
+class QuestionViewSet(ConditionalGetMixin, FastListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing poll questions
     """
     serializer_class = QuestionSerializer
+    fast_serializer_class = fast_serializers.FastQuestionSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['question_text', 'category']
     ordering_fields = ['pub_date', 'category']
-    ordering = ['-pub_date']
+    ordering = ['-pub_date', '-id']
+    pagination_class = QuestionPagination
     
     def get_queryset(self):
         """
@@ -60,80 +157,91 @@ class QuestionViewSet(viewsets.ModelViewSet):
             
         return queryset
     
+    def get_validators(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer.format
+        if self.action == 'retrieve':
+            state = conditional.question_state(kwargs['pk'])
+            if state is None:
+                return None
+            _question, version, last_modified = state
+            return conditional.make_etag(
+                'question', request.get_full_path(), version, renderer, request.user.pk
+            ), last_modified
+        # Any change to any question bumps the ALL version
+        version = cache_versions.get_version(cache_versions.ALL)
+        return conditional.make_etag('questions', request.get_full_path(), version, renderer, request.user.pk), None
+    
     def perform_create(self, serializer):
         """Set the author to the current user when creating a question"""
         serializer.save(author=self.request.user, pub_date=timezone.now())
     
-    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    @action(detail=False, methods=['post'], url_path='bulk',
+            permission_classes=[permissions.IsAuthenticated])
+    @idempotent
+    def bulk_create(self, request):
+        """
+        Create many questions with their choices at once, e.g. a content drop.
+
+        Expects [{"question_text": ..., "pub_date": ..., "choices": [{"choice_text": ...}, ...]}, ...]
+        and returns the created questions in the same order.
+        """
+        serializer = self.get_serializer(data=request.data, many=True, max_length=1000, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(author=request.user, pub_date=timezone.now())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated],
+            throttle_classes=[TokenBucketThrottle])
+    @idempotent
     def vote(self, request, pk=None):
         """Custom action to vote on a question"""
         question = self.get_object()
         
-        try:
-            choice_id = request.data.get('choice')
-            if not choice_id:
-                return Response(
-                    {'detail': 'You must specify a choice'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-                
-            choice = get_object_or_404(Choice, id=choice_id, question=question)
-            
-            with transaction.atomic():
-                # Try to get existing response
-                try:
-                    user_response = UserResponse.objects.get(
-                        user=request.user,
-                        question=question
-                    )
-                    
-                    # If changing vote, update
-                    if user_response.choice != choice:
-                        user_response.choice.votes -= 1
-                        user_response.choice.save()
-                        
-                        user_response.choice = choice
-                        user_response.save()
-                        
-                        choice.votes += 1
-                        choice.save()
-                        
-                        message = "Your vote has been updated"
-                    else:
-                        message = "You have already voted for this choice"
-                        
-                except UserResponse.DoesNotExist:
-                    # Create new response
-                    UserResponse.objects.create(
-                        user=request.user,
-                        question=question,
-                        choice=choice
-                    )
-                    
-                    choice.votes += 1
-                    choice.save()
-                    
-                    message = "Your vote has been recorded"
-                
-                # Update analytics
-                analytics, created = QuestionAnalytics.objects.get_or_create(question=question)
-                analytics.update_analytics()
-            
-            return Response({'detail': message})
-            
-        except Exception as e:
+        choice_id = request.data.get('choice')
+        if not choice_id:
             return Response(
-                {'detail': str(e)}, 
+                {'detail': 'You must specify a choice'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        vote = VoteSerializer(data={'question': question.id, 'choice': choice_id})
+        vote.is_valid(raise_exception=True)
+        choice = get_object_or_404(Choice, id=vote.validated_data['choice'], question=question)
+        
+        outcome = services.cast_vote(request.user, question.id, choice.id)
+        detail_messages = {
+            services.VOTE_CREATED: "Your vote has been recorded",
+            services.VOTE_CHANGED: "Your vote has been updated",
+            services.VOTE_UNCHANGED: "You have already voted for this choice",
+        }
+        return Response({'detail': detail_messages[outcome]})
+    
+    @action(detail=False, methods=['post'], url_path='vote-batch',
+            permission_classes=[permissions.IsAuthenticated],
+            throttle_classes=[TokenBucketThrottle])
+    @idempotent
+    def vote_batch(self, request):
+        """
+        Submit many votes at once, e.g. answers collected offline.
+        
+        Expects {"votes": [{"question": <id>, "choice": <id>}, ...]} and returns
+        a status per vote in the same order.
+        """
+        serializer = VoteBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        votes = [(vote['question'], vote['choice']) for vote in serializer.validated_data['votes']]
+        
+        results = services.cast_votes(request.user, votes)
+        return Response({'results': results})
 
 
-class ChoiceViewSet(viewsets.ModelViewSet):
+class ChoiceViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing choices
     """
     serializer_class = ChoiceSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = ChoicePagination
     
     def get_queryset(self):
         """
@@ -161,12 +269,14 @@ class ChoiceViewSet(viewsets.ModelViewSet):
         serializer.save(question=question)
 
 
-class UserResponseViewSet(viewsets.ReadOnlyModelViewSet):
+class UserResponseViewSet(FastListMixin, SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for viewing user responses
     """
     serializer_class = UserResponseSerializer
+    fast_serializer_class = fast_serializers.FastUserResponseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserResponsePagination
     
     def get_queryset(self):
         """
@@ -184,7 +294,7 @@ class UserResponseViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset.order_by('-response_date')
 
 
-class QuestionAnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
+class QuestionAnalyticsViewSet(ConditionalGetMixin, SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for viewing question analytics
     """
@@ -200,4 +310,12 @@ class QuestionAnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
         if user.is_staff:
             return QuestionAnalytics.objects.all()
         else:
-            return QuestionAnalytics.objects.filter(question__author=user) 
\ No newline at end of file
+            return QuestionAnalytics.objects.filter(question__author=user)
+    
+    def get_validators(self, request, *args, **kwargs):
+        # Which rows are visible depends on the user
+        version = cache_versions.get_version(cache_versions.ALL)
+        return conditional.make_etag(
+            'analytics', request.get_full_path(), version, request.accepted_renderer.format,
+            request.user.pk, request.user.is_staff
+        ), None 
\ No newline at end of file
@@ -0,0 +1,229 @@
+"""
+Async versions of the read-heavy views.
+
+Under ASGI a sync view holds a thread pool slot for its whole run, including
+every wait on the database and the cache. These views await the async ORM and
+cache APIs instead, and build the same pages and API payloads as the views
+in views.py and api_views.py. polls/urls.py routes to them when
+POLLS_ASYNC_VIEWS is on, which mysite/asgi.py does by default. Writes and
+everything else stay on the sync views.
+
+The question API only serves plain JSON reads itself. Token authenticated
+requests, the browsable API and writes are handed to QuestionViewSet.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.db.models import Count, Q
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404, render
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import cache_versions, conditional, read_cache, user_votes
+from .api_views import QuestionViewSet
+from .fast_serializers import FastQuestionSerializer
+from .models import Question
+from .views import INDEX_CACHE_TIMEOUT, aresults_tallies
+
+
+async def _resolve_user(request):
+    # Templates read request.user, which would otherwise load it synchronously
+    request.user = await request.auser()
+    return request.user
+
+
+async def _latest_questions():
+    return [
+        question async for question in Question.published.order_by("-pub_date").values(
+            'id', 'question_text', 'category', 'pub_date'
+        )[:5]
+    ]
+
+
+async def _category_counts():
+    return [
+        category async for category in Question.objects.exclude(
+            Q(category__isnull=True) | Q(category='')
+        ).values('category').annotate(count=Count('id')).order_by('category')
+    ]
+
+
+async def index(request):
+    user = await _resolve_user(request)
+    latest_question_list = await read_cache.aget_or_compute(
+        'index:latest_questions', _latest_questions, INDEX_CACHE_TIMEOUT
+    )
+    categories = await read_cache.aget_or_compute(
+        'index:category_counts', _category_counts, INDEX_CACHE_TIMEOUT
+    )
+
+    voted = await user_votes.avoted_map(user)
+    context = {
+        "latest_question_list": [
+            dict(question, voted=question['id'] in voted) for question in latest_question_list
+        ],
+        "categories": categories,
+    }
+    return render(request, "polls/index.html", context)
+
+
+async def detail(request, question_id):
+    user = await _resolve_user(request)
+    question = await aget_object_or_404(Question, pk=question_id)
+    choices = [choice async for choice in question.choice_set.all()]
+    voted_choice_id, response_date = (await user_votes.avoted_responses(user)).get(question.id, (None, None))
+    voted_choice = next((choice for choice in choices if choice.id == voted_choice_id), None)
+
+    return render(request, "polls/detail.html", {
+        "question": question,
+        "choices": choices,
+        "voted_choice": voted_choice,
+        "response_date": response_date,
+    })
+
+
+async def results(request, question_id):
+    user = await _resolve_user(request)
+    state = await conditional.aquestion_state(question_id)
+    if state is None:
+        raise Http404("No Question matches the given query.")
+    question, version, last_modified = state
+
+    voted_choice_id = (await user_votes.avoted_map(user)).get(question.id)
+    etag = conditional.make_etag('results', question.id, version, user.pk, voted_choice_id)
+    if not len(messages.get_messages(request)):
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return conditional.set_validators(response, etag, last_modified, private=True)
+
+    tallies = await aresults_tallies(question.id, version)
+    voted_choice = next(
+        (item for item in tallies['choices_with_percentage'] if item['id'] == voted_choice_id), None
+    )
+
+    response = render(request, "polls/results.html", {
+        "question": question,
+        "choices_with_percentage": tallies['choices_with_percentage'],
+        "total_votes": tallies['total_votes'],
+        "voted_choice": voted_choice
+    })
+    return conditional.set_validators(response, etag, last_modified, private=True)
+
+
+async def category_view(request, category):
+    user = await _resolve_user(request)
+    questions = [
+        question async for question in Question.published.filter(category=category).order_by('-pub_date')
+    ]
+    voted = await user_votes.avoted_map(user)
+    for question in questions:
+        question.voted = question.id in voted
+    return render(request, "polls/category.html", {
+        "category": category,
+        "questions": questions
+    })
+
+
+_sync_question_list = QuestionViewSet.as_view({'get': 'list', 'post': 'create'})
+_sync_question_detail = QuestionViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'
+})
+
+
+def _serves_json_read(request):
+    """Whether the request is a read that QuestionViewSet would answer with JSON"""
+    if request.method not in ('GET', 'HEAD') or 'HTTP_AUTHORIZATION' in request.META:
+        return False
+    fmt = request.GET.get('format')
+    if fmt is None:
+        return 'text/html' not in request.headers.get('Accept', '')
+    return fmt == 'json'
+
+
+def _question_viewset(request, action):
+    """A QuestionViewSet for building querysets and serializers, without its sync dispatch"""
+    view = QuestionViewSet(action=action, args=(), kwargs={}, format_kwarg=None)
+    view.request = Request(request)
+    return view
+
+
+def _json_response(data, etag, last_modified=None):
+    response = HttpResponse(JSONRenderer().render(data), content_type='application/json')
+    patch_vary_headers(response, ['Accept'])
+    return conditional.set_validators(response, etag, last_modified, private=True)
+
+
+def _handles_api_exceptions(view):
+    """Answer APIExceptions as DRF's exception handler would, which these views bypass"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            response = HttpResponse(
+                JSONRenderer().render(data), content_type='application/json', status=exc.status_code
+            )
+            patch_vary_headers(response, ['Accept'])
+            return response
+    return wrapper
+
+
+@csrf_exempt
+@_handles_api_exceptions
+async def question_list(request):
+    if not _serves_json_read(request):
+        return await sync_to_async(_sync_question_list)(request)
+
+    user = await request.auser()
+    version = await cache_versions.aget_version(cache_versions.ALL)
+    etag = conditional.make_etag('questions', request.get_full_path(), version, 'json', user.pk)
+    response = conditional.not_modified(request, etag)
+    if response is not None:
+        return conditional.set_validators(response, etag, private=True)
+
+    view = _question_viewset(request, 'list')
+    serializer = FastQuestionSerializer(view.get_serializer())
+    queryset = view.filter_queryset(view.get_queryset())
+    paginator = view.paginator
+    ordering = [field.lstrip('-') for field in paginator.get_ordering(view.request, queryset, view)]
+    rows = await paginator.apaginate_queryset(serializer.values(queryset, ordering), view.request, view)
+
+    choice_rows = serializer.choice_rows(rows)
+    if choice_rows is not None:
+        choice_rows = [row async for row in choice_rows]
+    data = paginator.get_paginated_response(serializer.to_representation(rows, choice_rows)).data
+    return _json_response(data, etag)
+
+
+@csrf_exempt
+@_handles_api_exceptions
+async def question_detail(request, pk):
+    state = await conditional.aquestion_state(pk) if _serves_json_read(request) else None
+    if state is None:
+        # Writes, other formats, and the 404 response
+        return await sync_to_async(_sync_question_detail)(request, pk=pk)
+
+    user = await request.auser()
+    _question, version, last_modified = state
+    etag = conditional.make_etag('question', request.get_full_path(), version, 'json', user.pk)
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is not None:
+        return conditional.set_validators(response, etag, last_modified, private=True)
+
+    view = _question_viewset(request, 'retrieve')
+    serializer = FastQuestionSerializer(view.get_serializer())
+    queryset = view.filter_queryset(view.get_queryset()).filter(pk=pk)
+    rows = [row async for row in serializer.values(queryset)]
+    if not rows:
+        return await sync_to_async(_sync_question_detail)(request, pk=pk)
+
+    choice_rows = serializer.choice_rows(rows)
+    if choice_rows is not None:
+        choice_rows = [row async for row in choice_rows]
+    return _json_response(serializer.to_representation(rows, choice_rows)[0], etag, last_modified)
@@ -0,0 +1,50 @@
+"""
+Bulk creation of questions with their choices.
+
+Questions, their QuestionAnalytics rows and their choices are each inserted
+with bulk_create, so a batch of BATCH_SIZE questions with up to ten choices
+each costs three INSERTs (more on SQLite, which limits the parameters per
+statement). bulk_create doesn't send post_save, so the analytics rows that
+signals.create_question_analytics would add are created here.
+"""
+from django.db import transaction
+
+from . import cache_versions
+from .models import Choice, Question, QuestionAnalytics
+
+BATCH_SIZE = 500
+
+
+def create_questions(questions, **defaults):
+    """
+    Create questions from dicts of Question fields, each with an optional
+    'choices' list of Choice field dicts. defaults (e.g. author, pub_date)
+    apply to every question. Returns the questions, in input order.
+    """
+    created = []
+    with transaction.atomic():
+        for start in range(0, len(questions), BATCH_SIZE):
+            created += _create_batch(questions[start:start + BATCH_SIZE], defaults)
+        # New questions have no cached entries yet; only lists go stale
+        cache_versions.bump_on_change([])
+    return created
+
+
+def _create_batch(questions, defaults):
+    instances = []
+    choices = []
+    for data in questions:
+        data = {**data, **defaults}
+        choices.append(data.pop('choices', []))
+        instances.append(Question(**data))
+
+    instances = Question.objects.bulk_create(instances, batch_size=BATCH_SIZE)
+    QuestionAnalytics.objects.bulk_create(
+        [QuestionAnalytics(question=question) for question in instances], batch_size=BATCH_SIZE
+    )
+    Choice.objects.bulk_create([
+        Choice(question=question, **choice)
+        for question, question_choices in zip(instances, choices)
+        for choice in question_choices
+    ], batch_size=BATCH_SIZE * 10)
+    return instances
@@ -0,0 +1,127 @@
+"""
+Two-tier cache backend.
+
+TieredCache keeps a small per-process LRU (a private LocMemCache) in front of
+a shared cache alias such as Redis. Only keys under
+L1_PREFIXES are kept in the local tier, and for at most L1_TIMEOUT seconds.
+Those keys should be versioned (see polls.cache_versions) or tolerate that
+much staleness. Version counters, locks, rate limit buckets and everything
+else always go to the shared tier, so a version bump in one worker is seen
+by every other worker on its next lookup.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'polls.cache_backends.TieredCache',
+            'OPTIONS': {'SHARED': 'shared', 'L1_PREFIXES': ['results:']},
+        },
+        'shared': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', ...},
+    }
+"""
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options['SHARED']
+        self._l1_prefixes = tuple(options.get('L1_PREFIXES', ()))
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        # LocMemCache storage is per name, so every thread of the process
+        # shares this tier
+        self._l1 = LocMemCache(f'tiered-l1-{location}', {
+            'TIMEOUT': self._l1_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000)},
+        })
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _in_l1(self, key):
+        return isinstance(key, str) and key.startswith(self._l1_prefixes)
+
+    def _l1_timeout_for(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self._l1_timeout
+        return min(timeout, self._l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        if not self._in_l1(key):
+            return self.shared.get(key, default, version=version)
+        value = self._l1.get(key, version=version)
+        if value is None:
+            value = self.shared.get(key, version=version)
+            if value is None:
+                return default
+            self._l1.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._l1.get(key, version=version) if self._in_l1(key) else None
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                if self._in_l1(key):
+                    self._l1.set(key, value, version=version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        if self._in_l1(key):
+            self._l1.set(key, value, self._l1_timeout_for(timeout), version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if self._in_l1(key) and key not in failed:
+                self._l1.set(key, value, self._l1_timeout_for(timeout), version=version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1.delete(key, version=version)
+        return self.shared.add(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1.delete(key, version=version)
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._l1.delete(key, version=version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1.delete(key, version=version)
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._l1.delete(key, version=version)
+        return self.shared.decr(key, delta, version=version)
+
+    def clear(self):
+        self._l1.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """Drop this process's local tier only"""
+        self._l1.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
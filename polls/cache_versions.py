@@ -0,0 +1,79 @@
+"""
+Per-question cache versions.
+
+Every cached value derived from a question's votes or choices (the results
+page, chart ETags, API payloads) has the question's current version in its
+key. Bumping the version on a vote makes all of them unreachable at once, so
+nothing has to know which keys to delete; stale entries simply expire.
+
+Every bump also bumps the ALL version, which changes whenever any question
+does and validates question lists.
+
+A missing version is initialised from the clock rather than to 1, so a
+counter that was evicted from the cache never comes back with a value that
+older keys or ETags were built with.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'question_version:{}'
+ALL = 'all'
+
+
+def _initial_version():
+    return int(time.time() * 1000000)
+
+
+def get_version(question_id):
+    key = VERSION_KEY.format(question_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(question_id):
+    key = VERSION_KEY.format(question_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def get_versions(question_ids):
+    """Return {question_id: version} for several questions with one cache read"""
+    keys = {VERSION_KEY.format(question_id): question_id for question_id in question_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for question_id in set(question_ids) - set(versions):
+        versions[question_id] = get_version(question_id)
+    return versions
+
+
+def bump(question_ids):
+    for question_id in set(question_ids) | {ALL}:
+        key = VERSION_KEY.format(question_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), timeout=None)
+
+
+def bump_on_change(question_ids):
+    """
+    Bump now and again once the surrounding transaction commits. A reader
+    that runs in between caches pre-commit data under the intermediate
+    version, which the second bump discards.
+    """
+    question_ids = set(question_ids)
+    bump(question_ids)
+    transaction.on_commit(lambda: bump(question_ids))
+
+
+def versioned_key(prefix, question_id, *parts, version=None):
+    version = get_version(question_id) if version is None else version
+    return ':'.join([prefix, str(question_id), f'v{version}', *map(str, parts)])
@@ -0,0 +1,107 @@
+"""
+Out-of-request chart rendering.
+
+matplotlib holds the GIL for the whole rasterization, so charts are drawn in a
+bounded process pool, or by a Celery worker, and never in a request thread.
+A request never waits for a render either: if the chart isn't cached yet it
+queues one and returns None, and the caller falls back to the HTML bar list
+until a later request finds the chart in the cache.
+
+POLLS_CHART_RENDERER['MODE'] selects 'process' (default), 'celery', or
+'inline' (render in the calling thread; meant for tests and debugging).
+Celery workers store charts in the chart cache, which is only shared with the
+web processes when POLLS_CACHE_BACKEND is 'redis'. Backends that are cheap
+enough, like the SVG one, always render inline.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import charts
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = {}
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_CHART_RENDERER', {}).get(name, default)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Fresh interpreters rather than forks of a multi-threaded server process
+            _executor = ProcessPoolExecutor(
+                max_workers=_option('WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _submit(key, spec):
+    """Queue a render job, sharing it with identical jobs already in flight"""
+    with _executor_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future
+        if len(_in_flight) >= _option('MAX_PENDING', 16):
+            logger.warning("Chart render queue is full, skipping chart")
+            return None
+
+    future = _get_executor().submit(charts.render_chart, spec)
+    with _executor_lock:
+        _in_flight[key] = future
+
+    def done(completed):
+        with _executor_lock:
+            _in_flight.pop(key, None)
+        if completed.exception() is not None:
+            logger.error(f"Chart rendering failed: {completed.exception()}")
+        else:
+            charts.store_chart(key, completed.result())
+
+    future.add_done_callback(done)
+    return future
+
+
+def _submit_to_celery(key, spec):
+    """Queue a render task, unless one for the same chart is already queued"""
+    from .tasks import render_results_chart
+
+    if caches[charts.CHART_CACHE_ALIAS].add(rendering_key(key), 1, timeout=_option('PENDING_TIMEOUT', 60)):
+        render_results_chart.delay(key, spec)
+
+
+def rendering_key(key):
+    return f'{key}:rendering'
+
+
+def get_chart(question, choices, fmt='png'):
+    """
+    Return the chart image bytes, or None if it isn't rendered yet
+    """
+    key = charts.chart_cache_key(question, choices, fmt)
+    image = charts.get_cached_chart(key)
+    if image is not None:
+        return image
+
+    spec = charts.chart_spec(question, choices, fmt)
+    mode = _option('MODE', 'process')
+    if mode == 'inline' or charts.BACKENDS[spec['backend']].inline:
+        image = charts.render_chart(spec)
+        charts.store_chart(key, image)
+        return image
+    # The pool's done callback or the worker stores the chart for a later request
+    if mode == 'celery':
+        _submit_to_celery(key, spec)
+    else:
+        _submit(key, spec)
+    return None
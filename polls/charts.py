@@ -0,0 +1,231 @@
+"""
+Results chart drawing.
+
+Charts are described by a plain, picklable spec and drawn by a pluggable
+backend. The default for SVG is a dependency-free renderer that takes
+microseconds; matplotlib is only needed for PNG export and is imported the
+first time it is used. POLLS_CHART_BACKENDS maps each format to a backend name.
+
+Rendered charts are kept in the 'charts' cache, keyed by question id and a
+fingerprint of the vote counts, so a chart is only drawn again once the counts
+change. The size of that cache is bounded by its MAX_ENTRIES and by
+POLLS_CHART_CACHE_MAX_BYTES per chart.
+"""
+import hashlib
+import io
+import math
+from html import escape
+
+from django.conf import settings
+from django.core.cache import caches
+
+CHART_CACHE_ALIAS = 'charts'
+CHART_CACHE_TIMEOUT = 60 * 60
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+DEFAULT_BACKENDS = {
+    'png': 'matplotlib',
+    'svg': 'svg',
+}
+
+# Evenly spaced samples of matplotlib's viridis colormap
+VIRIDIS = [
+    (0x44, 0x01, 0x54), (0x48, 0x24, 0x75), (0x41, 0x44, 0x87), (0x35, 0x5f, 0x8d),
+    (0x2a, 0x78, 0x8e), (0x21, 0x91, 0x8c), (0x22, 0xa8, 0x84), (0x44, 0xbf, 0x70),
+    (0x7a, 0xd1, 0x51), (0xbd, 0xdf, 0x26), (0xfd, 0xe7, 0x25),
+]
+
+
+def viridis(position):
+    """Interpolate a viridis colour for a position between 0 and 1, as '#rrggbb'"""
+    scaled = min(max(position, 0.0), 1.0) * (len(VIRIDIS) - 1)
+    index = min(int(scaled), len(VIRIDIS) - 2)
+    fraction = scaled - index
+    low, high = VIRIDIS[index], VIRIDIS[index + 1]
+    return '#' + ''.join(f'{round(a + (b - a) * fraction):02x}' for a, b in zip(low, high))
+
+
+def bar_colors(count):
+    """Same spread as viridis(np.linspace(0.1, 0.9, count))"""
+    if count == 1:
+        return [viridis(0.1)]
+    return [viridis(0.1 + 0.8 * i / (count - 1)) for i in range(count)]
+
+
+def annotation(value, total_votes):
+    percentage = f'{(value/total_votes)*100:.1f}%' if total_votes > 0 else '0%'
+    return f'{int(value)} ({percentage})'
+
+
+class ChartBackend:
+    """Draws a chart spec into image bytes"""
+    name = None
+    formats = ()
+    # Cheap enough to run in the request thread rather than the render pool
+    inline = False
+
+    def render(self, spec):
+        raise NotImplementedError
+
+
+class SVGChartBackend(ChartBackend):
+    """Pure-Python horizontal bar chart, laid out like the matplotlib one"""
+    name = 'svg'
+    formats = ('svg',)
+    inline = True
+
+    width = 1000
+    height = 600
+    font = 'DejaVu Sans, Arial, sans-serif'
+
+    def _ticks(self, maximum):
+        if maximum <= 0:
+            return [0, 1], 1
+        raw_step = maximum / 5
+        magnitude = 10 ** math.floor(math.log10(raw_step))
+        step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw_step)
+        step = max(step, 1)
+        top = math.ceil(maximum / step) * step
+        return list(range(0, int(top) + 1, int(step))), top
+
+    def render(self, spec):
+        labels = spec['labels']
+        values = spec['values']
+        total_votes = sum(values)
+        colors = bar_colors(len(values))
+
+        label_width = min(300, 20 + 7 * max((len(label) for label in labels), default=0))
+        left, right, top, bottom = label_width, 40, 70, 70
+        plot_width = self.width - left - right
+        plot_height = self.height - top - bottom
+
+        ticks, axis_max = self._ticks(max(values, default=0))
+        # Leave room for the annotation after the longest bar
+        scale = plot_width / (axis_max * 1.25)
+        slot = plot_height / max(len(values), 1)
+        bar_height = slot * 0.8
+
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" '
+            f'viewBox="0 0 {self.width} {self.height}" font-family="{self.font}" font-size="12">',
+            f'<rect width="{self.width}" height="{self.height}" fill="#fff"/>',
+            f'<text x="{self.width / 2:.1f}" y="35" font-size="14" text-anchor="middle">{escape(spec["title"])}</text>',
+        ]
+        for tick in ticks:
+            x = left + tick * scale
+            parts.append(
+                f'<line x1="{x:.1f}" y1="{top + plot_height}" x2="{x:.1f}" y2="{top + plot_height + 5}" stroke="#000"/>'
+                f'<text x="{x:.1f}" y="{top + plot_height + 20}" text-anchor="middle">{tick}</text>'
+            )
+        # Like barh, the first choice is drawn at the bottom
+        for index, (label, value, color) in enumerate(zip(labels, values, colors)):
+            center = top + plot_height - slot * (index + 0.5)
+            bar_width = value * scale
+            parts.append(
+                f'<rect x="{left}" y="{center - bar_height / 2:.1f}" width="{bar_width:.1f}" '
+                f'height="{bar_height:.1f}" fill="{color}"/>'
+                f'<text x="{left - 8}" y="{center:.1f}" text-anchor="end" dominant-baseline="middle">{escape(label)}</text>'
+                f'<text x="{left + bar_width + 0.5 * scale + 4:.1f}" y="{center:.1f}" '
+                f'dominant-baseline="middle">{annotation(value, total_votes)}</text>'
+            )
+        parts.append(
+            f'<path d="M{left} {top}V{top + plot_height}H{left + plot_width}" fill="none" stroke="#000"/>'
+            f'<text x="{left + plot_width / 2:.1f}" y="{self.height - 20}" text-anchor="middle">Number of Votes</text>'
+            '</svg>'
+        )
+        return ''.join(parts).encode()
+
+
+class MatplotlibChartBackend(ChartBackend):
+    """
+    matplotlib rendering for PNG export, using the object-oriented Figure API
+    so there is no pyplot global state
+    """
+    name = 'matplotlib'
+    formats = ('png', 'svg')
+
+    def render(self, spec):
+        import numpy as np
+        from matplotlib import colormaps
+        from matplotlib.figure import Figure
+
+        labels = spec['labels']
+        values = spec['values']
+        total_votes = sum(values)
+
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        colors = colormaps['viridis'](np.linspace(0.1, 0.9, len(values)))
+
+        # Create horizontal bar chart
+        bars = ax.barh(labels, values, color=colors)
+
+        # Add values and percentage annotations
+        for bar in bars:
+            width = bar.get_width()
+            ax.text(
+                width + 0.5,
+                bar.get_y() + bar.get_height()/2,
+                annotation(width, total_votes),
+                va='center'
+            )
+
+        # Customize chart
+        ax.set_title(spec['title'], fontsize=14, pad=20)
+        ax.set_xlabel('Number of Votes', fontsize=12)
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        fig.tight_layout()
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=spec['fmt'])
+        return buffer.getvalue()
+
+
+BACKENDS = {backend.name: backend for backend in (SVGChartBackend, MatplotlibChartBackend)}
+
+
+def get_backend(fmt):
+    """Backend configured for an output format"""
+    configured = getattr(settings, 'POLLS_CHART_BACKENDS', {})
+    name = configured.get(fmt, DEFAULT_BACKENDS[fmt])
+    return BACKENDS[name]()
+
+
+def chart_fingerprint(question, choices):
+    """Hash of everything drawn on the chart"""
+    state = '|'.join(f'{choice.pk}:{choice.votes}:{choice.choice_text}' for choice in choices)
+    return hashlib.sha1(f'{question.question_text}|{state}'.encode()).hexdigest()
+
+
+def chart_cache_key(question, choices, fmt):
+    backend = get_backend(fmt).name
+    return f'results_chart:{question.pk}:{fmt}:{backend}:{chart_fingerprint(question, choices)}'
+
+
+def chart_spec(question, choices, fmt='png'):
+    """Everything needed to draw the chart, without model instances"""
+    return {
+        'title': f'Results: {question.question_text}',
+        'labels': [choice.choice_text for choice in choices],
+        'values': [choice.votes for choice in choices],
+        'fmt': fmt,
+        # Resolved here because render pool processes have no Django settings
+        'backend': get_backend(fmt).name,
+    }
+
+
+def render_chart(spec):
+    """Draw a chart spec with its backend and return the image bytes"""
+    return BACKENDS[spec['backend']]().render(spec)
+
+
+def get_cached_chart(key):
+    return caches[CHART_CACHE_ALIAS].get(key)
+
+
+def store_chart(key, image):
+    if len(image) <= getattr(settings, 'POLLS_CHART_CACHE_MAX_BYTES', 256 * 1024):
+        caches[CHART_CACHE_ALIAS].set(key, image, CHART_CACHE_TIMEOUT)
@@ -0,0 +1,65 @@
+"""
+Conditional GET helpers.
+
+Validators are built from the per-question cache versions (one cache read)
+and QuestionAnalytics.last_vote_date (one primary key query), so answering a
+revalidation with 304 never loads choices or renders anything.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import cache_versions
+from .models import Question
+
+
+def _last_modified(question):
+    try:
+        last_vote_date = question.questionanalytics.last_vote_date
+    except Question.questionanalytics.RelatedObjectDoesNotExist:
+        last_vote_date = None
+    return int((last_vote_date or question.pub_date).timestamp())
+
+
+def question_state(question_id):
+    """
+    Return (question, version, last_modified timestamp) for a question, or
+    None if it doesn't exist
+    """
+    if not str(question_id).isdigit():
+        return None
+    question = Question.objects.select_related('questionanalytics').filter(pk=question_id).first()
+    if question is None:
+        return None
+    return question, cache_versions.get_version(question.pk), _last_modified(question)
+
+
+async def aquestion_state(question_id):
+    if not str(question_id).isdigit():
+        return None
+    question = await Question.objects.select_related('questionanalytics').filter(pk=question_id).afirst()
+    if question is None:
+        return None
+    return question, await cache_versions.aget_version(question.pk), _last_modified(question)
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a 304 (or 412) response if the client's copy is current, else None"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified=None, private=False):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Always revalidate, which is cheap thanks to the ETag
+    if private:
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
@@ -0,0 +1,124 @@
+"""
+Streaming exports of a poll's responses.
+
+Rows are read with values_list().iterator(), joining only the username and
+choice text, and written out one at a time, so memory use stays the same
+however many responses a poll has. The same generators feed the staff
+download view and the export_poll_data task, which writes to a file. Under
+ASGI the view streams astream(), which reads the rows in chunks from a thread.
+"""
+import csv
+import itertools
+import json
+import os
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UserResponse
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CSV_HEADER = ['Username', 'Choice', 'Timestamp']
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_EXPORT', {}).get(name, default)
+
+
+def _responses(question_id):
+    return UserResponse.objects.filter(question_id=question_id).order_by('pk').values_list(
+        'user__username', 'choice__choice_text', 'response_date'
+    )
+
+
+def response_rows(question_id):
+    """(username, choice_text, response_date) for every response, in chunks"""
+    return _responses(question_id).iterator(chunk_size=_option('CHUNK_SIZE', 2000))
+
+
+async def aresponse_rows(question_id):
+    """response_rows() as an async iterator, fetching a chunk per thread hop"""
+    # Not values_list().aiterator(), which runs the query on the event loop
+    rows = response_rows(question_id)
+    chunk_size = _option('CHUNK_SIZE', 2000)
+    fetch = sync_to_async(lambda: list(itertools.islice(rows, chunk_size)))
+    while chunk := await fetch():
+        for row in chunk:
+            yield row
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each line instead of storing it"""
+    def write(self, value):
+        return value
+
+
+def csv_format():
+    """The header lines and a row -> line function of a CSV export"""
+    writer = csv.writer(_Echo())
+
+    def format_row(row):
+        username, choice_text, response_date = row
+        return writer.writerow([username, choice_text, response_date.strftime('%Y-%m-%d %H:%M:%S')])
+
+    return [writer.writerow(CSV_HEADER)], format_row
+
+
+def ndjson_format():
+    """The header lines and a row -> line function of an NDJSON export"""
+    def format_row(row):
+        username, choice_text, response_date = row
+        return json.dumps({
+            'username': username,
+            'choice': choice_text,
+            'timestamp': response_date.isoformat(),
+        }) + '\n'
+
+    return [], format_row
+
+
+FORMATS = {'csv': csv_format, 'ndjson': ndjson_format}
+
+
+def stream(question_id, fmt):
+    """Lines of the export in fmt ('csv' or 'ndjson')"""
+    header, format_row = FORMATS[fmt]()
+    yield from header
+    for row in response_rows(question_id):
+        yield format_row(row)
+
+
+async def astream(question_id, fmt):
+    """
+    stream() for async views. StreamingHttpResponse would otherwise collect a
+    sync iterator into a list in a thread before sending any of it.
+    """
+    header, format_row = FORMATS[fmt]()
+    for line in header:
+        yield line
+    async for row in aresponse_rows(question_id):
+        yield format_row(row)
+
+
+def write_file(question_id, fmt, directory=None):
+    """Write the export to a new file in directory and return its path"""
+    directory = directory or _option('DIRECTORY', tempfile.gettempdir())
+    os.makedirs(directory, exist_ok=True)
+    name = f'question-{question_id}-{timezone.now():%Y%m%d%H%M%S}.{fmt}'
+    path = os.path.join(directory, name)
+
+    # Written under a temporary name, so a half written file is never picked up
+    fd, partial = tempfile.mkstemp(dir=directory, prefix=f'.{name}.')
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as output:
+            output.writelines(stream(question_id, fmt))
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return path
@@ -0,0 +1,118 @@
+"""
+Read-only serialization fast path for API lists.
+
+ModelSerializer builds a model instance for every row and then runs each
+field's to_representation. For the big read-only lists, these serializers
+build the same output straight from values() rows, and group nested choices
+from a single values_list() query in one pass. The output is identical to the
+regular serializer's, including ?fields= and ?expand= handling. Switched on
+with POLLS_API_FAST_SERIALIZATION.
+"""
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import Choice
+
+_datetime_field = serializers.DateTimeField()
+
+
+def is_enabled():
+    return getattr(settings, 'POLLS_API_FAST_SERIALIZATION', False)
+
+
+class FastSerializer:
+    # Output field name -> values() lookup, in the regular serializer's order
+    columns = {}
+    datetime_fields = ()
+
+    def __init__(self, serializer):
+        """serializer is the regular serializer, already narrowed by ?fields= and ?expand="""
+        self.field_names = [name for name in serializer.fields if name in self.columns or self.is_nested(name)]
+
+    def is_nested(self, name):
+        return False
+
+    def values(self, queryset, extra=()):
+        lookups = {self.columns[name] for name in self.field_names if name in self.columns}
+        return queryset.prefetch_related(None).values(*lookups | set(extra))
+
+    def to_representation(self, rows):
+        fields = [
+            (name, self.columns[name], name in self.datetime_fields, '__' in self.columns[name])
+            for name in self.field_names if name in self.columns
+        ]
+        data = []
+        for row in rows:
+            item = {}
+            for name, lookup, is_datetime, is_related in fields:
+                value = row[lookup]
+                if value is None:
+                    if is_related:
+                        # A null relation is skipped, like ReadOnlyField does
+                        continue
+                elif is_datetime:
+                    value = _datetime_field.to_representation(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+
+class FastQuestionSerializer(FastSerializer):
+    """Same output as QuestionSerializer"""
+    columns = {
+        'id': 'id',
+        'question_text': 'question_text',
+        'pub_date': 'pub_date',
+        'category': 'category',
+        'is_published': 'is_published',
+        'author_username': 'author__username',
+    }
+    datetime_fields = ('pub_date',)
+
+    def is_nested(self, name):
+        return name == 'choices'
+
+    def values(self, queryset, extra=()):
+        extra = set(extra)
+        if 'choices' in self.field_names:
+            extra.add('id')
+        return super().values(queryset, extra)
+
+    def choice_rows(self, rows):
+        """(question_id, id, choice_text, votes) of the rows' choices, or None if not wanted"""
+        if 'choices' not in self.field_names:
+            return None
+        # Same query as prefetch_related('choice_set'), so the same row order
+        return Choice.objects.filter(question_id__in=[row['id'] for row in rows]).values_list(
+            'question_id', 'id', 'choice_text', 'votes'
+        )
+
+    def to_representation(self, rows, choice_rows=None):
+        """choice_rows may be passed in already evaluated, e.g. by async views"""
+        rows = list(rows)
+        data = super().to_representation(rows)
+        if choice_rows is None:
+            choice_rows = self.choice_rows(rows)
+            if choice_rows is None:
+                return data
+
+        choices = {row['id']: [] for row in rows}
+        for question_id, choice_id, choice_text, votes in choice_rows:
+            choices[question_id].append({'id': choice_id, 'choice_text': choice_text, 'votes': votes})
+
+        for row, item in zip(rows, data):
+            # Keep the declared field order, with choices last
+            item['choices'] = choices[row['id']]
+        return data
+
+
+class FastUserResponseSerializer(FastSerializer):
+    """Same output as UserResponseSerializer"""
+    columns = {
+        'id': 'id',
+        'username': 'user__username',
+        'question_text': 'question__question_text',
+        'choice_text': 'choice__choice_text',
+        'response_date': 'response_date',
+    }
+    datetime_fields = ('response_date',)
@@ -0,0 +1,99 @@
+"""
+Idempotency-Key support for API write actions.
+
+The first response for a given (user, path, Idempotency-Key) is stored in the
+cache; a retry with the same key gets that response back without running the
+action again. While the first request is still running, duplicates wait for
+its result instead of running concurrently.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_IDEMPOTENCY', {}).get(name, default)
+
+
+def _fingerprint(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_keys(user_id, path, key):
+    """Return the (result, lock) cache keys for an idempotency key"""
+    scope = hashlib.sha256(f'{user_id}:{path}:{key}'.encode()).hexdigest()
+    return f'idempotency:{scope}', f'idempotency:lock:{scope}'
+
+
+def _wait_for_result(cache_key):
+    deadline = time.monotonic() + _option('WAIT', 5)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return stored
+    return None
+
+
+def idempotent(view_method):
+    """
+    Decorator for viewset actions honouring an optional Idempotency-Key header
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key, lock_key = cache_keys(request.user.pk, request.path, key)
+        fingerprint = _fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is None:
+            if cache.add(lock_key, 1, timeout=_option('LOCK_TIMEOUT', 30)):
+                try:
+                    response = view_method(self, request, *args, **kwargs)
+                    # Server errors are not stored so that the client can retry them
+                    if response.status_code < 500:
+                        cache.set(cache_key, {
+                            'fingerprint': fingerprint,
+                            'status': response.status_code,
+                            'data': response.data,
+                        }, timeout=_option('TTL', 60 * 60 * 24))
+                finally:
+                    cache.delete(lock_key)
+                return response
+
+            stored = _wait_for_result(cache_key)
+            if stored is None:
+                return Response(
+                    {'detail': 'A request with this Idempotency-Key is already in progress'},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+        if stored['fingerprint'] != fingerprint:
+            return Response(
+                {'detail': 'Idempotency-Key was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        response = Response(stored['data'], status=stored['status'])
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+    return wrapper
@@ -0,0 +1,169 @@
+"""
+Live vote counts for the results page, pushed over Server-Sent Events.
+
+Each ASGI worker runs one Hub per event loop. Connections subscribe to a
+question and wait on an asyncio.Event, so an idle connection is a suspended
+coroutine and a keepalive comment every KEEPALIVE seconds. While anything is
+subscribed, the hub checks the subscribed questions' cache versions (one
+cache read for all of them) at most MAX_RATE times a second. The versions are
+bumped when a vote commits, on whichever worker took it, so the cache is the
+broker: a shared Redis cache fans votes out across workers, and the
+default per-process cache stands in for a single worker.
+
+Only questions whose version changed have their counts read, and only the
+choices whose counts changed are sent. A subscriber that hasn't been written
+to yet has newer deltas merged into its pending one, so slow clients get
+fewer, larger updates rather than a backlog.
+"""
+import asyncio
+import json
+import logging
+import weakref
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import cache_versions, services
+from .models import Choice
+
+logger = logging.getLogger(__name__)
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_LIVE', {}).get(name, default)
+
+
+def vote_counts(question_ids):
+    """Return {question_id: {choice_id: votes}}, including votes not yet applied"""
+    choices = services.apply_pending_votes(list(
+        Choice.objects.filter(question_id__in=question_ids).only('id', 'question_id', 'votes')
+    ))
+    counts = {question_id: {} for question_id in question_ids}
+    for choice in choices:
+        counts[choice.question_id][choice.id] = choice.votes
+    return counts
+
+
+class Subscription:
+    def __init__(self, question_id):
+        self.question_id = question_id
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, delta):
+        # Counts are absolute, so merging keeps the latest value per choice
+        self.pending.update(delta)
+        self.ready.set()
+
+    async def next(self, timeout):
+        """Return the pending {choice_id: votes} delta, or None after timeout"""
+        if not self.ready.is_set():
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        self.ready.clear()
+        delta, self.pending = self.pending, {}
+        return delta
+
+
+class Hub:
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.versions = {}
+        self.counts = {}
+        self.task = None
+
+    async def subscribe(self, question_id):
+        """Return a Subscription and the question's current {choice_id: votes}"""
+        if question_id not in self.counts:
+            # Version first, so a vote in between is picked up by the next poll
+            version = await sync_to_async(cache_versions.get_version)(question_id)
+            counts = await sync_to_async(vote_counts)([question_id])
+            self.versions.setdefault(question_id, version)
+            self.counts.setdefault(question_id, counts[question_id])
+        subscription = Subscription(question_id)
+        self.subscriptions[question_id].add(subscription)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+        return subscription, dict(self.counts[question_id])
+
+    def unsubscribe(self, subscription):
+        question_id = subscription.question_id
+        self.subscriptions[question_id].discard(subscription)
+        if not self.subscriptions[question_id]:
+            del self.subscriptions[question_id]
+            self.versions.pop(question_id, None)
+            self.counts.pop(question_id, None)
+
+    async def run(self):
+        while self.subscriptions:
+            await asyncio.sleep(1 / _option('MAX_RATE', 2))
+            try:
+                await self.poll()
+            except Exception:
+                # Keep polling; subscribers get the counts once the cache or database is back
+                logger.exception("Failed to poll live vote counts")
+
+    async def poll(self):
+        """Push deltas for questions whose version changed since the last poll"""
+        question_ids = list(self.subscriptions)
+        if not question_ids:
+            return
+        versions = await sync_to_async(cache_versions.get_versions)(question_ids)
+        changed = [
+            question_id for question_id in question_ids
+            if versions[question_id] != self.versions.get(question_id)
+        ]
+        if not changed:
+            return
+        counts = await sync_to_async(vote_counts)(changed)
+        for question_id in changed:
+            if question_id not in self.subscriptions:
+                continue
+            self.versions[question_id] = versions[question_id]
+            previous = self.counts.get(question_id, {})
+            self.counts[question_id] = counts[question_id]
+            delta = {
+                choice_id: votes for choice_id, votes in counts[question_id].items()
+                if previous.get(choice_id) != votes
+            }
+            if delta:
+                for subscription in self.subscriptions[question_id]:
+                    subscription.push(delta)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """The hub of the running event loop"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = Hub()
+    return hub
+
+
+def format_event(event, counts):
+    return f'event: {event}\ndata: {json.dumps(counts, separators=(",", ":"))}\n\n'
+
+
+def format_snapshot(counts):
+    """The first event of a stream, with the client's reconnection delay"""
+    return f'retry: {_option("RETRY", 3000)}\n' + format_event('snapshot', counts)
+
+
+async def event_stream(question_id):
+    """SSE lines: a 'snapshot' of all counts, then a 'delta' per change"""
+    hub = get_hub()
+    subscription, snapshot = await hub.subscribe(question_id)
+    keepalive = _option('KEEPALIVE', 15)
+    try:
+        yield format_snapshot(snapshot)
+        while True:
+            delta = await subscription.next(keepalive)
+            yield format_event('delta', delta) if delta else ': keepalive\n\n'
+    finally:
+        hub.unsubscribe(subscription)
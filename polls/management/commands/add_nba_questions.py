@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
-from polls.models import Question, Choice
+from polls import bulk
+from polls.models import Question
 from django.utils import timezone
 
 class Command(BaseCommand):
@@ -34,26 +35,24 @@ class Command(BaseCommand):
             }
         ]
         
+        # Skip questions that already exist
+        existing = set(Question.objects.filter(
+            question_text__in=[q_data["question_text"] for q_data in questions]
+        ).values_list('question_text', flat=True))
+        new_questions = []
         for q_data in questions:
-            # Check if question already exists
-            if not Question.objects.filter(question_text=q_data["question_text"]).exists():
-                q = Question.objects.create(
-                    question_text=q_data["question_text"],
-                    pub_date=timezone.now(),
-                    category=q_data["category"],
-                    is_published=True
-                )
-                
-                # Add choices
-                for choice_text in q_data["choices"]:
-                    Choice.objects.create(
-                        question=q,
-                        choice_text=choice_text,
-                        votes=0
-                    )
-                
-                self.stdout.write(self.style.SUCCESS(f'Added question: "{q_data["question_text"]}"'))
-            else:
+            if q_data["question_text"] in existing:
                 self.stdout.write(self.style.WARNING(f'Question already exists: "{q_data["question_text"]}"'))
+                continue
+            new_questions.append({
+                "question_text": q_data["question_text"],
+                "category": q_data["category"],
+                "is_published": True,
+                "choices": [{"choice_text": choice_text, "votes": 0} for choice_text in q_data["choices"]],
+            })
+        
+        # All new questions, their choices and analytics in a few INSERTs
+        for q in bulk.create_questions(new_questions, pub_date=timezone.now()):
+            self.stdout.write(self.style.SUCCESS(f'Added question: "{q.question_text}"'))
         
         self.stdout.write(self.style.SUCCESS('Successfully added NBA questions')) 
\ No newline at end of file
@@ -0,0 +1,42 @@
+import gzip
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from polls import charts
+
+
+class Command(BaseCommand):
+    help = 'Compares render time and payload size of the chart backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--choices', type=int, default=5, help='Number of bars per chart')
+        parser.add_argument('--iterations', type=int, default=20, help='Renders per backend')
+
+    def handle(self, *args, **options):
+        count = options['choices']
+        iterations = options['iterations']
+        spec = {
+            'title': 'Results: Who is the greatest NBA player of all time?',
+            'labels': [f'Choice number {i + 1}' for i in range(count)],
+            'values': [(i * 37) % 101 for i in range(count)],
+        }
+        cases = [
+            ('svg', 'svg'),
+            ('matplotlib', 'svg'),
+            ('matplotlib', 'png'),
+        ]
+
+        self.stdout.write(f'{"backend":<12}{"format":<8}{"ms/render":>12}{"bytes":>10}{"gzipped":>10}')
+        for backend, fmt in cases:
+            case_spec = dict(spec, backend=backend, fmt=fmt)
+            try:
+                image = charts.render_chart(case_spec)
+            except ImportError as e:
+                self.stdout.write(self.style.WARNING(f'{backend:<12}{fmt:<8}skipped ({e})'))
+                continue
+            seconds = timeit.timeit(lambda: charts.render_chart(case_spec), number=iterations)
+            self.stdout.write(
+                f'{backend:<12}{fmt:<8}{seconds / iterations * 1000:>12.3f}'
+                f'{len(image):>10}{len(gzip.compress(image)):>10}'
+            )
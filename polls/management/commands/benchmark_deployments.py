@@ -0,0 +1,128 @@
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+DEPLOYMENTS = {
+    # name: (gunicorn arguments, extra environment, required modules)
+    'wsgi': (['mysite.wsgi:application'], {'POLLS_ASYNC_VIEWS': 'False'}, ['gunicorn']),
+    'asgi': (
+        ['mysite.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+        {'POLLS_ASYNC_VIEWS': 'True'},
+        ['gunicorn', 'uvicorn'],
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares throughput and latency of the WSGI deployment (sync views) and the ASGI '
+        'deployment (async read views) under the same number of gunicorn workers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers per deployment')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per path and deployment')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request, may be repeated (default: the index page and the question API)'
+        )
+        parser.add_argument('--deployment', action='append', choices=list(DEPLOYMENTS), dest='deployments')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/polls/', '/polls/api/questions/?expand=choices']
+        deployments = options['deployments'] or list(DEPLOYMENTS)
+        for name in deployments:
+            missing = [module for module in DEPLOYMENTS[name][2] if importlib.util.find_spec(module) is None]
+            if missing:
+                raise CommandError(f"The {name} deployment needs {', '.join(missing)} installed")
+
+        self.stdout.write(
+            f"{options['workers']} workers, {options['concurrency']} concurrent requests, "
+            f"{options['requests']} requests per path\n"
+        )
+        self.stdout.write(f'{"deployment":<12}{"path":<40}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for name in deployments:
+            with self.serve(name, options['workers'], options['port']):
+                for path in paths:
+                    url = f"http://127.0.0.1:{options['port']}{path}"
+                    rate, latencies, errors = self.load(url, options['requests'], options['concurrency'])
+                    self.stdout.write(
+                        f'{name:<12}{path[:39]:<40}{rate:>10.0f}'
+                        f'{statistics.median(latencies) * 1000:>10.1f}'
+                        f'{statistics.quantiles(latencies, n=100)[98] * 1000:>10.1f}{errors:>8}'
+                    )
+
+    def serve(self, name, workers, port):
+        arguments, environment, _modules = DEPLOYMENTS[name]
+        command = [
+            sys.executable, '-m', 'gunicorn', *arguments,
+            '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+        ]
+        return _Server(command, dict(os.environ, **environment), port, cwd=settings.BASE_DIR)
+
+    def load(self, url, count, concurrency):
+        def fetch(_):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        # Warm up each worker's caches and connections
+        for _ in range(concurrency):
+            fetch(None)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(fetch, range(count)))
+        elapsed = time.perf_counter() - start
+        latencies = [latency for latency, _ok in results]
+        errors = sum(1 for _latency, ok in results if not ok)
+        return count / elapsed, latencies, errors
+
+
+class _Server:
+    """Runs a gunicorn deployment for the duration of a with block"""
+
+    def __init__(self, command, env, port, cwd):
+        self.command = command
+        self.env = env
+        self.port = port
+        self.cwd = cwd
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, env=self.env, cwd=self.cwd)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"{' '.join(self.command)} exited with {self.process.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise CommandError(f'Server on port {self.port} did not start')
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
@@ -0,0 +1,98 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from polls.fast_serializers import FastQuestionSerializer, FastUserResponseSerializer
+from polls.models import Choice, Question, UserResponse
+from polls.serializers import QuestionSerializer, UserResponseSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares rows per second of the model serializers and the values() fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Questions (and responses) to serialize')
+        parser.add_argument('--choices', type=int, default=4, help='Choices per question')
+        parser.add_argument('--iterations', type=int, default=5, help='Runs per case; the best is reported')
+
+    def handle(self, *args, **options):
+        # The sample rows are created in a transaction that is rolled back
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        user = User.objects.create_user(username='benchmark-serializers')
+        questions = Question.objects.bulk_create([
+            Question(question_text=f'Benchmark question {i}', pub_date=timezone.now(), category='NBA', author=user)
+            for i in range(options['rows'])
+        ])
+        choices = Choice.objects.bulk_create([
+            Choice(question=question, choice_text=f'Choice {i}', votes=i)
+            for question in questions for i in range(options['choices'])
+        ])
+        UserResponse.objects.bulk_create([
+            UserResponse(user=user, question=choice.question, choice=choice)
+            for choice in choices[::options['choices']]
+        ])
+
+        question_ids = [question.pk for question in questions]
+        cases = [
+            (
+                'questions',
+                QuestionSerializer,
+                FastQuestionSerializer,
+                Question.objects.filter(pk__in=question_ids).order_by('pk'),
+                ('author',),
+                ('choice_set',),
+            ),
+            (
+                'responses',
+                UserResponseSerializer,
+                FastUserResponseSerializer,
+                UserResponse.objects.filter(user=user).order_by('pk'),
+                ('user', 'question', 'choice'),
+                (),
+            ),
+        ]
+
+        self.stdout.write(f'{"endpoint":<12}{"path":<10}{"rows/s":>12}{"speedup":>10}')
+        for name, serializer_class, fast_class, queryset, select, prefetch in cases:
+            # Without a request every field is output, as with ?expand=choices
+            serializer = serializer_class()
+
+            def regular():
+                return serializer_class(
+                    queryset.select_related(*select).prefetch_related(*prefetch), many=True
+                ).data
+
+            fast_serializer = fast_class(serializer)
+
+            def fast():
+                return fast_serializer.to_representation(fast_serializer.values(queryset))
+
+            if [dict(item) for item in regular()] != fast():
+                raise CommandError(f'{name}: the fast path output differs from {serializer_class.__name__}')
+
+            rows = queryset.count()
+            baseline = None
+            for label, function in (('model', regular), ('values', fast)):
+                seconds = min(self.time(function) for _ in range(options['iterations']))
+                rate = rows / seconds
+                baseline = baseline or rate
+                self.stdout.write(f'{name:<12}{label:<10}{rate:>12.0f}{rate / baseline:>9.1f}x')
+
+    def time(self, function):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from polls import startup
+
+
+class Command(BaseCommand):
+    help = 'Reports what importing the WSGI application costs on a cold start'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='mysite.wsgi', help='Module to import')
+        parser.add_argument('--limit', type=int, default=25, help='Number of modules to list')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative')
+
+    def handle(self, *args, **options):
+        module = options['module']
+        timed = startup.profile_import(module)
+        profile = startup.profile_import(module, importtime=True)
+        budget = getattr(settings, 'POLLS_IMPORT_BUDGET', {})
+
+        self.stdout.write(
+            f"import {module}: {timed['seconds'] * 1000:.1f} ms, {len(timed['modules'])} modules "
+            f"(budget {budget.get('SECONDS', '-')} s, {budget.get('MODULES', '-')} modules)"
+        )
+
+        column = 2 if options['sort'] == 'cumulative' else 1
+        rows = sorted(profile['imports'], key=lambda row: row[column], reverse=True)
+        self.stdout.write(f'\n{"cumulative ms":>14}{"self ms":>10}  module')
+        for name, own, cumulative, _depth in rows[:options['limit']]:
+            self.stdout.write(f'{cumulative / 1000:>14.1f}{own / 1000:>10.1f}  {name}')
+
+        heavy = startup.heavy_modules(timed['modules'])
+        if heavy:
+            self.stdout.write(self.style.WARNING(f"\nHeavy modules imported at startup: {', '.join(heavy)}"))
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_missing_analytics(apps, schema_editor):
+    """Analytics rows are now created with the question; backfill older questions"""
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    QuestionAnalytics = apps.get_model('polls', 'QuestionAnalytics')
+    UserResponse = apps.get_model('polls', 'UserResponse')
+
+    missing = Question.objects.filter(questionanalytics__isnull=True)
+    rows = []
+    for question in missing:
+        total_votes = sum(Choice.objects.filter(question=question).values_list('votes', flat=True))
+        latest = UserResponse.objects.filter(question=question).order_by('-response_date').first()
+        rows.append(QuestionAnalytics(
+            question=question,
+            total_votes=total_votes,
+            last_vote_date=latest.response_date if latest else None,
+        ))
+    QuestionAnalytics.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_questionanalytics_questionwithmetadata_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_analytics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_voteevent_votecompactioncheckpoint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='polls_quest_pub_dat_5d0c19_idx',
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['pub_date', 'id'], name='polls_quest_pub_dat_306bbb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userresponse',
+            index=models.Index(fields=['user', 'response_date', 'id'], name='polls_userr_user_id_ec005d_idx'),
+        ),
+    ]
@@ -2,7 +2,7 @@ import datetime
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db.models import Case, F, IntegerField, Sum, Value, When
 from django.conf import settings
 
 # Conditionally import PostgreSQL-specific fields
@@ -30,6 +30,23 @@ class PublishedQuestionManager(models.Manager):
         return super().get_queryset().filter(is_published=True)
 
 
+class ChoiceManager(models.Manager):
+    def add_votes(self, deltas):
+        """
+        Apply a {choice_id: delta} mapping to Choice.votes in a single UPDATE
+        """
+        deltas = {choice_id: delta for choice_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        return self.filter(pk__in=deltas).update(
+            votes=F('votes') + Case(
+                *[When(pk=choice_id, then=Value(delta)) for choice_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+
+
 class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField("date published")
@@ -43,7 +60,8 @@ class Question(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['pub_date']),
+            # Keyset pagination order, see polls/pagination.py
+            models.Index(fields=['pub_date', 'id']),
             models.Index(fields=['category']),
         ]
     
@@ -58,6 +76,9 @@ class Choice(models.Model):
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice_text = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
+    
+    objects = ChoiceManager()
+    
     def __str__(self):
         return self.choice_text
 
@@ -69,16 +90,91 @@ class UserResponse(models.Model):
     
     class Meta:
         unique_together = ['user', 'question']
+        indexes = [
+            # A user's responses in keyset pagination order
+            models.Index(fields=['user', 'response_date', 'id']),
+        ]
         
     def __str__(self):
         return f"{self.user.username} - {self.question.question_text[:30]}"
 
+class VoteEvent(models.Model):
+    """
+    Append-only log of votes. Rows are only ever inserted; deferred events
+    still have to be folded into Choice.votes and QuestionAnalytics by
+    compaction (see polls.vote_events).
+    """
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    previous_choice = models.ForeignKey(Choice, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    event_date = models.DateTimeField(auto_now_add=True)
+    deferred = models.BooleanField(default=False)
+    
+    def __str__(self):
+        return f"Vote for choice {self.choice_id} on question {self.question_id}"
+
+
+class VoteCompactionCheckpoint(models.Model):
+    """High-water mark of the last VoteEvent folded into the counters"""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
+
+
+class QuestionAnalyticsManager(models.Manager):
+    def record_vote(self, question_id, new_vote=True):
+        """
+        Update analytics by delta: +1 for a new vote, 0 for a changed one
+        """
+        return self.record_votes({question_id: 1 if new_vote else 0})
+    
+    def record_votes(self, new_votes, vote_dates=None):
+        """
+        Apply a {question_id: number_of_new_votes} mapping in a single UPDATE
+        and set last_vote_date on every question in it, to now unless a
+        {question_id: datetime} mapping is given
+        """
+        if not new_votes:
+            return 0
+        last_vote_date = timezone.now()
+        if vote_dates:
+            last_vote_date = Case(
+                *[When(question_id=question_id, then=Value(date)) for question_id, date in vote_dates.items()],
+                default=Value(last_vote_date),
+                output_field=models.DateTimeField(),
+            )
+        updated = self.filter(question_id__in=new_votes).update(
+            total_votes=F('total_votes') + Case(
+                *[When(question_id=question_id, then=Value(count)) for question_id, count in new_votes.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            last_vote_date=last_vote_date,
+        )
+        if updated < len(new_votes):
+            # Questions created before analytics were maintained eagerly
+            existing = set(self.filter(question_id__in=new_votes).values_list('question_id', flat=True))
+            for question_id in set(new_votes) - existing:
+                analytics, created = self.get_or_create(question_id=question_id)
+                analytics.update_analytics()
+        return updated
+
+
 class QuestionAnalytics(models.Model):
     question = models.OneToOneField(Question, on_delete=models.CASCADE)
     total_votes = models.IntegerField(default=0)
     last_vote_date = models.DateTimeField(null=True, blank=True)
     
+    objects = QuestionAnalyticsManager()
+    
     def update_analytics(self):
+        """
+        Recompute analytics from scratch. Vote paths use record_vote() instead;
+        this is only needed to repair drifted rows.
+        """
         self.total_votes = self.question.choice_set.aggregate(Sum('votes'))['votes__sum'] or 0
         latest_response = UserResponse.objects.filter(question=self.question).order_by('-response_date').first()
         if latest_response:
@@ -0,0 +1,187 @@
+"""
+Keyset pagination for the API.
+
+Pages are selected with a WHERE clause on the ordering columns, e.g.
+(pub_date, id) < (last seen pub_date, last seen id), rather than an OFFSET,
+so with a matching index every page costs the same as the first. The primary
+key is always appended to the ordering to make positions unique. The cursor
+is an opaque token holding the position of the first or last row of the page
+the client came from.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_API_PAGINATION', {}).get(name, default)
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    # Used unless the view has an OrderingFilter
+    ordering = ('-pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=_option('MAX_PAGE_SIZE', 100)
+            )
+        except (KeyError, ValueError):
+            return _option('PAGE_SIZE', 20)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+        ordering = list(ordering or self.ordering)
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return bool(cursor['r']), list(cursor['p'])
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse, position):
+        # Unlike DjangoJSONEncoder, keep full microsecond precision
+        cursor = json.dumps(
+            {'r': int(reverse), 'p': position},
+            default=lambda value: value.isoformat() if hasattr(value, 'isoformat') else str(value),
+            separators=(',', ':'),
+        )
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _position(self, instance):
+        # Instances, or values() rows from the fast serialization path
+        if isinstance(instance, dict):
+            return [instance[field.lstrip('-')] for field in self.ordering_fields]
+        return [getattr(instance, field.lstrip('-')) for field in self.ordering_fields]
+
+    def _after(self, queryset, position):
+        """Rows strictly after position in self.ordering_fields order"""
+        model = queryset.model
+        values = []
+        for field, value in zip(self.ordering_fields, position):
+            name = field.lstrip('-')
+            model_field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            values.append((name, field.startswith('-'), model_field.to_python(value)))
+
+        condition = Q()
+        equal = Q()
+        for name, descending, value in values:
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return queryset.filter(condition)
+
+    def _page_queryset(self, queryset, request, view):
+        """The queryset of the requested page, plus one row to see if there are more"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor[0]
+
+        # Walking backwards reads the reversed ordering and flips the page
+        if self.reverse:
+            self.ordering_fields = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        else:
+            self.ordering_fields = ordering
+        queryset = queryset.order_by(*self.ordering_fields)
+        if self.cursor is not None:
+            if len(self.cursor[1]) != len(ordering):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                queryset = self._after(queryset, self.cursor[1])
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        self.ordering_fields = ordering
+        return queryset[:self.page_size + 1]
+
+    def _page(self, results):
+        cursor, reverse = self.cursor, self.reverse
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None if not reverse else has_more
+        self.first_position = self._position(results[0]) if results else None
+        self.last_position = self._position(results[-1]) if results else None
+        if not results and cursor is not None:
+            # Past either end; link back to where the client came from
+            self.first_position = self.last_position = cursor[1]
+            self.has_next, self.has_previous = reverse, not reverse
+        return results
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._page(list(self._page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views"""
+        return self._page([row async for row in self._page_queryset(queryset, request, view)])
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(False, self.last_position)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(True, self.first_position)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class QuestionPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+
+
+class ChoicePagination(KeysetPagination):
+    ordering = ('id',)
+
+
+class UserResponsePagination(KeysetPagination):
+    ordering = ('-response_date', '-id')
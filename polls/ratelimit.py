@@ -0,0 +1,121 @@
+"""
+Cache-backed token buckets for write endpoints.
+
+Each (scope, client) pair gets a bucket of `capacity` tokens that refills
+continuously at `capacity` tokens per `period`, so a client can burst up to
+`capacity` requests and is then held to the rate. The bucket is stored as a
+single number, the time at which it will be full again (the generic cell rate
+algorithm). Taking a token is one atomic cache increment of that time by one
+token's refill interval, so the check is cheap enough to run before any ORM
+work on every request. The key expires at the first period boundary after
+the bucket is full, so its expiry is only extended once a period's worth of
+tokens; that, creating a bucket, refunding a token to an empty one, and
+catching up when a request arrives after the bucket refilled each cost one
+more cache call. Rates come
+from POLLS_RATE_LIMITS, e.g. {'vote': '30/m'}; scopes without a rate are not
+limited.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+MICROSECONDS = 1000000
+
+
+def parse_rate(rate):
+    """Parse '<count>/<period>' such as '30/m' or '1000/day' into (count, seconds)"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class TokenBucket:
+    def __init__(self, scope, rate):
+        self.scope = scope
+        self.capacity, self.period = parse_rate(rate)
+
+    @classmethod
+    def for_scope(cls, scope):
+        rate = getattr(settings, 'POLLS_RATE_LIMITS', {}).get(scope)
+        return cls(scope, rate) if rate else None
+
+    def consume(self, ident):
+        """
+        Take a token for ident. Returns (allowed, seconds until a token is available).
+        """
+        key = f'ratelimit:{self.scope}:{ident}'
+        now = int(time.time() * MICROSECONDS)
+        period = self.period * MICROSECONDS
+        interval = period // self.capacity
+        try:
+            full_at = cache.incr(key, interval)
+        except ValueError:
+            # No bucket, so it is full
+            if cache.add(key, now + interval, timeout=self._timeout(now + interval, now)):
+                return True, 0
+            full_at = cache.incr(key, interval)
+        before = full_at - interval
+
+        if full_at < now + interval:
+            # Full before this request; tokens don't accumulate past capacity
+            full_at = cache.incr(key, now + interval - full_at)
+        if full_at - now > period:
+            # Empty: give the token back
+            cache.decr(key, interval)
+            return False, max(1, math.ceil((full_at - now) / MICROSECONDS - self.period))
+        if before // period != full_at // period:
+            # The key lives until the next period boundary after the time the
+            # bucket is full, so it only needs extending when that is crossed
+            cache.touch(key, self._timeout(full_at, now))
+        return True, 0
+
+    def _timeout(self, full_at, now):
+        period = self.period * MICROSECONDS
+        return math.ceil(((full_at // period + 1) * period - now) / MICROSECONDS)
+
+
+def client_ident(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def rate_limit(scope):
+    """
+    Decorator for function views rejecting requests over the scope's rate with 429
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            bucket = TokenBucket.for_scope(scope)
+            if bucket is not None:
+                allowed, retry_after = bucket.consume(client_ident(request))
+                if not allowed:
+                    response = HttpResponse("Too many requests, please slow down.", status=429)
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle using the view's `throttle_scope`, or the action name, as scope
+    """
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None) or getattr(view, 'action', None)
+        bucket = TokenBucket.for_scope(scope) if scope else None
+        if bucket is None:
+            return True
+        allowed, self.retry_after = bucket.consume(client_ident(request))
+        return allowed
+
+    def wait(self):
+        return getattr(self, 'retry_after', None)
@@ -0,0 +1,128 @@
+"""
+Read-through caching with stampede protection.
+
+get_or_compute() stores evaluated, compact values (lists of dicts or tuples,
+never querysets or model instances) together with how long they took to
+compute. Entries are refreshed early with probability rising as they near
+expiry ("XFetch"), so one request recomputes a hot entry before it expires
+instead of every worker recomputing it at the same moment. The refresh is
+single-flight: whoever takes the lock recomputes while the others keep
+serving the previous value, which is kept around for one extra timeout.
+
+aget_or_compute() is the same for async views, with an async compute().
+"""
+import asyncio
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_READ_CACHE', {}).get(name, default)
+
+
+def _compute_and_store(key, compute, timeout):
+    start = time.time()
+    value = compute()
+    now = time.time()
+    cache.set(key, (value, now - start, now + timeout), timeout * 2)
+    return value
+
+
+def _wait_for_entry(key):
+    deadline = time.monotonic() + _option('WAIT', 2)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _is_fresh(entry, beta):
+    _value, delta, expires = entry
+    # 1 - random() is in (0, 1], so the log is defined
+    return time.time() - delta * beta * math.log(1.0 - random.random()) < expires
+
+
+def get_or_compute(key, compute, timeout, beta=None):
+    """
+    Return the cached value for key, calling compute() to (re)build it when it
+    is missing or due for refresh. A larger beta refreshes earlier.
+    """
+    beta = _option('BETA', 1.0) if beta is None else beta
+    lock_key = f'{key}:refresh'
+
+    entry = cache.get(key)
+    if entry is not None:
+        value = entry[0]
+        if _is_fresh(entry, beta):
+            return value
+        if not cache.add(lock_key, 1, timeout=_option('LOCK_TIMEOUT', 10)):
+            return value
+        try:
+            return _compute_and_store(key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    if cache.add(lock_key, 1, timeout=_option('LOCK_TIMEOUT', 10)):
+        try:
+            return _compute_and_store(key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    entry = _wait_for_entry(key)
+    if entry is not None:
+        return entry[0]
+    # The worker holding the lock is slow or gone; don't fail the request
+    return compute()
+
+
+async def _acompute_and_store(key, compute, timeout):
+    start = time.time()
+    value = await compute()
+    now = time.time()
+    await cache.aset(key, (value, now - start, now + timeout), timeout * 2)
+    return value
+
+
+async def _await_entry(key):
+    deadline = time.monotonic() + _option('WAIT', 2)
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+async def aget_or_compute(key, compute, timeout, beta=None):
+    """Async get_or_compute(); compute is a coroutine function"""
+    beta = _option('BETA', 1.0) if beta is None else beta
+    lock_key = f'{key}:refresh'
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        value = entry[0]
+        if _is_fresh(entry, beta):
+            return value
+        if not await cache.aadd(lock_key, 1, timeout=_option('LOCK_TIMEOUT', 10)):
+            return value
+        try:
+            return await _acompute_and_store(key, compute, timeout)
+        finally:
+            await cache.adelete(lock_key)
+
+    if await cache.aadd(lock_key, 1, timeout=_option('LOCK_TIMEOUT', 10)):
+        try:
+            return await _acompute_and_store(key, compute, timeout)
+        finally:
+            await cache.adelete(lock_key)
+
+    entry = await _await_entry(key)
+    if entry is not None:
+        return entry[0]
+    return await compute()
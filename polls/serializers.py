@@ -1,17 +1,59 @@
-from rest_framework import serializers
+from rest_framework import permissions, serializers
 from django.contrib.auth.models import User
+from django.db.models import prefetch_related_objects
 from .models import Question, Choice, UserResponse, QuestionAnalytics
+from . import bulk
 
 
-class ChoiceSerializer(serializers.ModelSerializer):
+def query_list(request, param):
+    """Comma separated values of a query parameter, e.g. ?fields=id,question_text"""
+    return {value for value in request.query_params.get(param, '').split(',') if value}
+
+
+class DynamicFieldsMixin:
+    """
+    Lets API clients pick fields: ?fields=id,question_text keeps only the named
+    fields, and nested serializers listed in Meta.expandable_fields are left
+    out of reads unless named in ?expand=
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        fields = query_list(request, 'fields')
+        expand = query_list(request, 'expand')
+        # Writes may send nested data, e.g. a question's choices
+        if request.method in permissions.SAFE_METHODS:
+            for name in getattr(self.Meta, 'expandable_fields', ()):
+                if name not in expand:
+                    self.fields.pop(name, None)
+        if fields:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
+
+
+class ChoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Choice
         fields = ['id', 'choice_text', 'votes']
         read_only_fields = ['votes']
 
 
-class QuestionSerializer(serializers.ModelSerializer):
-    choices = ChoiceSerializer(many=True, read_only=True, source='choice_set')
+class QuestionListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        """Insert all questions and their choices with a few bulk INSERTs"""
+        for data in validated_data:
+            data['choices'] = data.pop('choice_set', [])
+        questions = bulk.create_questions(validated_data)
+        # One query for every question's choices when the response is rendered
+        prefetch_related_objects(questions, 'choice_set')
+        return questions
+
+
+class QuestionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    choices = ChoiceSerializer(many=True, required=False, source='choice_set')
     author_username = serializers.ReadOnlyField(source='author.username')
     
     class Meta:
@@ -19,21 +61,31 @@ class QuestionSerializer(serializers.ModelSerializer):
         fields = ['id', 'question_text', 'pub_date', 'category', 
                   'is_published', 'author_username', 'choices']
         read_only_fields = ['author_username']
+        expandable_fields = ['choices']
+        list_serializer_class = QuestionListSerializer
         
     def create(self, validated_data):
-        choices_data = self.context.get('choices', [])
-        
-        # Create the question
-        question = Question.objects.create(**validated_data)
-        
-        # Create choices for the question
-        for choice_data in choices_data:
-            Choice.objects.create(question=question, **choice_data)
-            
+        """Create the question together with any nested choices"""
+        validated_data['choices'] = validated_data.pop('choice_set', [])
+        question, = bulk.create_questions([validated_data])
         return question
+    
+    def update(self, instance, validated_data):
+        if 'choice_set' in validated_data:
+            raise serializers.ValidationError({'choices': 'Choices are edited through /api/choices/'})
+        return super().update(instance, validated_data)
+
+
+class VoteSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    choice = serializers.IntegerField()
+
+
+class VoteBatchSerializer(serializers.Serializer):
+    votes = VoteSerializer(many=True, allow_empty=False, max_length=500)
 
 
-class UserResponseSerializer(serializers.ModelSerializer):
+class UserResponseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     question_text = serializers.ReadOnlyField(source='question.question_text')
     choice_text = serializers.ReadOnlyField(source='choice.choice_text')
@@ -44,7 +96,7 @@ class UserResponseSerializer(serializers.ModelSerializer):
         read_only_fields = ['response_date']
 
 
-class QuestionAnalyticsSerializer(serializers.ModelSerializer):
+class QuestionAnalyticsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     question_text = serializers.ReadOnlyField(source='question.question_text')
     
     class Meta:
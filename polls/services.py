@@ -0,0 +1,170 @@
+"""
+Vote service shared by the web and API vote paths.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+
+from .models import Choice, UserResponse, QuestionAnalytics, VoteEvent
+from . import cache_versions, user_votes, vote_buffer, vote_events
+
+VOTE_CREATED = 'created'
+VOTE_CHANGED = 'changed'
+VOTE_UNCHANGED = 'unchanged'
+
+
+def cast_vote(user, question_id, choice_id):
+    """
+    Record a user's vote on a question and adjust the counters.
+
+    The caller is responsible for checking that the choice belongs to the
+    question. Returns VOTE_CREATED, VOTE_CHANGED or VOTE_UNCHANGED.
+    """
+    try:
+        return _cast_vote(user, question_id, choice_id)
+    except IntegrityError:
+        # A concurrent request inserted this user's response first; the retry
+        # finds and locks that row instead
+        return _cast_vote(user, question_id, choice_id)
+
+
+def _cast_vote(user, question_id, choice_id):
+    with transaction.atomic():
+        previous = UserResponse.objects.select_for_update().filter(
+            user=user, question_id=question_id
+        ).values_list('pk', 'choice_id').first()
+
+        if previous is None:
+            UserResponse.objects.create(user=user, question_id=question_id, choice_id=choice_id)
+            _count_votes(user, [(question_id, choice_id, None)])
+            return VOTE_CREATED
+
+        response_id, previous_choice_id = previous
+        if previous_choice_id == choice_id:
+            return VOTE_UNCHANGED
+
+        UserResponse.objects.filter(pk=response_id).update(choice_id=choice_id)
+        _count_votes(user, [(question_id, choice_id, previous_choice_id)])
+        return VOTE_CHANGED
+
+
+def cast_votes(user, votes):
+    """
+    Record many (question_id, choice_id) votes for one user in one transaction.
+
+    Returns a result dict per vote, in input order, with a 'status' of
+    VOTE_CREATED, VOTE_CHANGED, VOTE_UNCHANGED or 'error' (plus a 'detail').
+    """
+    results = [{'question': question_id, 'choice': choice_id} for question_id, choice_id in votes]
+
+    choice_questions = dict(
+        Choice.objects.filter(pk__in={choice_id for _, choice_id in votes}).values_list('pk', 'question_id')
+    )
+    accepted = {}
+    for index, (question_id, choice_id) in enumerate(votes):
+        if choice_questions.get(choice_id) != question_id:
+            results[index].update(status='error', detail='Invalid choice for this question')
+        elif question_id in accepted:
+            results[index].update(status='error', detail='Duplicate question in batch')
+        else:
+            accepted[question_id] = (index, choice_id)
+
+    if accepted:
+        try:
+            outcomes = _cast_votes(user, accepted)
+        except IntegrityError:
+            # See cast_vote(): responses created concurrently are found on retry
+            outcomes = _cast_votes(user, accepted)
+        for question_id, outcome in outcomes.items():
+            results[accepted[question_id][0]]['status'] = outcome
+    return results
+
+
+def _cast_votes(user, accepted):
+    with transaction.atomic():
+        existing = {
+            question_id: (response_id, choice_id)
+            for response_id, question_id, choice_id in UserResponse.objects.select_for_update().filter(
+                user=user, question_id__in=accepted
+            ).values_list('pk', 'question_id', 'choice_id')
+        }
+
+        outcomes = {}
+        to_create = []
+        to_update = []
+        counted = []
+        for question_id, (index, choice_id) in accepted.items():
+            previous = existing.get(question_id)
+            if previous is None:
+                to_create.append(UserResponse(user=user, question_id=question_id, choice_id=choice_id))
+                counted.append((question_id, choice_id, None))
+                outcomes[question_id] = VOTE_CREATED
+            elif previous[1] == choice_id:
+                outcomes[question_id] = VOTE_UNCHANGED
+            else:
+                to_update.append(UserResponse(pk=previous[0], choice_id=choice_id))
+                counted.append((question_id, choice_id, previous[1]))
+                outcomes[question_id] = VOTE_CHANGED
+
+        if to_create:
+            UserResponse.objects.bulk_create(to_create)
+        if to_update:
+            UserResponse.objects.bulk_update(to_update, ['choice'])
+        _count_votes(user, counted)
+        return outcomes
+
+
+def _count_votes(user, votes):
+    """
+    Append a VoteEvent per (question_id, choice_id, previous_choice_id) vote
+    and adjust the counters, unless they are deferred to event compaction
+    """
+    if not votes:
+        return
+    deferred = vote_events.is_enabled()
+    VoteEvent.objects.bulk_create([
+        VoteEvent(
+            user=user,
+            question_id=question_id,
+            choice_id=choice_id,
+            previous_choice_id=previous_choice_id,
+            deferred=deferred,
+        )
+        for question_id, choice_id, previous_choice_id in votes
+    ])
+    user_votes.record_on_commit(user, {question_id: choice_id for question_id, choice_id, _ in votes})
+    if not deferred:
+        _adjust_counters(votes)
+    # After the counters, so that in buffered mode the post-commit bump runs
+    # once add_votes has put the deltas in the cache: a reader between the two
+    # would otherwise cache tallies without the vote under the final version
+    cache_versions.bump_on_change(question_id for question_id, _, _ in votes)
+
+
+def _adjust_counters(votes):
+    """Update Choice.votes (or the vote buffer) and QuestionAnalytics for the votes"""
+    choice_deltas = Counter()
+    new_votes = Counter()
+    for question_id, choice_id, previous_choice_id in votes:
+        choice_deltas[choice_id] += 1
+        if previous_choice_id is None:
+            new_votes[question_id] += 1
+        else:
+            choice_deltas[previous_choice_id] -= 1
+            new_votes[question_id] += 0
+    vote_buffer.record_votes(dict(choice_deltas))
+    QuestionAnalytics.objects.record_votes(dict(new_votes))
+
+
+def apply_pending_votes(choices):
+    """
+    Add votes that are not yet in Choice.votes (buffered or uncompacted) to a
+    list of Choice instances in place
+    """
+    if vote_buffer.is_enabled():
+        return vote_buffer.apply_pending(choices)
+    if vote_events.is_enabled():
+        deltas = vote_events.pending_deltas([choice.pk for choice in choices])
+        for choice in choices:
+            choice.votes += deltas.get(choice.pk, 0)
+    return choices
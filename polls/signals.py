@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache_versions
+from .models import Choice, Question, QuestionAnalytics
+
+
+@receiver(post_save, sender=Question)
+def create_question_analytics(sender, instance, created, raw=False, **kwargs):
+    """Create the analytics row together with the question so votes only need an UPDATE"""
+    if created and not raw:
+        QuestionAnalytics.objects.create(question=instance)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def bump_question_version(sender, instance, raw=False, **kwargs):
+    """Edited questions and choices invalidate everything cached for the question"""
+    if not raw:
+        cache_versions.bump_on_change([instance.pk if sender is Question else instance.question_id])
@@ -0,0 +1,56 @@
+"""
+Cold start import profiling.
+
+Serverless functions and freshly scaled workers import the whole WSGI stack
+before serving their first request, so anything imported at module level is
+paid for on every cold start. Heavy optional dependencies are imported on
+first use instead; profile_import() measures what is left.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+
+# Should never be imported just to serve requests
+HEAVY_MODULES = ('celery', 'kombu', 'matplotlib', 'numpy', 'pandas')
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def profile_import(module='mysite.wsgi', importtime=False):
+    """
+    Import module in a fresh interpreter and return its cost as a dict with
+    'seconds', 'modules' and, with importtime, per-module 'imports' rows of
+    (name, self microseconds, cumulative microseconds, depth).
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', SCRIPT.format(module=module)]
+    result = subprocess.run(
+        command, capture_output=True, text=True, check=True,
+        cwd=settings.BASE_DIR, env=os.environ.copy(),
+    )
+
+    profile = json.loads(result.stdout.strip().splitlines()[-1])
+    profile['imports'] = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            profile['imports'].append((name, int(own), int(cumulative), len(indent) // 2))
+    return profile
+
+
+def heavy_modules(modules):
+    return sorted(name for name in modules if name.split('.')[0] in HEAVY_MODULES)
@@ -3,31 +3,79 @@ from django.utils import timezone
 from django.core.mail import send_mail
 from django.db.models import Count, Sum, F
 from django.conf import settings
-import csv
-import io
 import logging
 
+# Web processes don't load the Celery app at startup, so bind the tasks to
+# the project's app (and its broker settings) before anything is queued
+from mysite import celery_app  # noqa: F401
+
 logger = logging.getLogger(__name__)
 
 @shared_task
 def update_all_analytics():
     """
-    Update all question analytics records
+    Recompute all question analytics records from scratch.
+    
+    Votes keep analytics up to date incrementally; this repairs any drift.
     """
     from .models import QuestionAnalytics
+    from . import cache_versions
     
     count = 0
+    question_ids = []
     for analytics in QuestionAnalytics.objects.select_related('question').all():
         try:
             analytics.update_analytics()
+            question_ids.append(analytics.question_id)
             count += 1
         except Exception as e:
             logger.error(f"Error updating analytics for question {analytics.question_id}: {str(e)}")
+    cache_versions.bump(question_ids)
     
     logger.info(f"Updated analytics for {count} questions")
     return f"Updated analytics for {count} questions"
 
 
+@shared_task
+def flush_vote_buffer():
+    """
+    Write buffered vote increments to Choice.votes
+    """
+    from . import vote_buffer
+    
+    flushed = vote_buffer.flush()
+    if flushed is None:
+        return "Vote buffer flush already in progress"
+    return f"Flushed buffered votes for {flushed} choices"
+
+
+@shared_task
+def compact_vote_events(chunk_size=None):
+    """
+    Fold new vote events into Choice.votes and QuestionAnalytics
+    """
+    from . import vote_events
+    
+    processed = vote_events.compact(chunk_size)
+    return f"Compacted {processed} vote events"
+
+
+@shared_task(soft_time_limit=30, time_limit=60)
+def render_results_chart(key, spec):
+    """
+    Render a results chart outside the web process and store it in the chart cache
+    """
+    from django.core.cache import caches
+
+    from . import chart_renderer, charts
+    
+    try:
+        charts.store_chart(key, charts.render_chart(spec))
+    finally:
+        caches[charts.CHART_CACHE_ALIAS].delete(chart_renderer.rendering_key(key))
+    return key
+
+
 @shared_task
 def generate_daily_report():
     """
@@ -90,42 +138,28 @@ def generate_daily_report():
 
 
 @shared_task
-def export_poll_data(question_id):
+def export_poll_data(question_id, fmt='csv'):
     """
-    Export all votes for a specific poll to CSV
+    Export all votes for a specific poll to a CSV (or NDJSON) file and return its path
     """
-    from .models import Question, UserResponse
+    from .models import Question
+    from . import exports
     
     try:
-        question = Question.objects.get(id=question_id)
-        responses = UserResponse.objects.filter(question=question).select_related('user', 'choice')
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Username', 'Choice', 'Timestamp'])
-        
-        # Write data
-        for response in responses:
-            writer.writerow([
-                response.user.username,
-                response.choice.choice_text,
-                response.response_date.strftime('%Y-%m-%d %H:%M:%S')
-            ])
+        if not Question.objects.filter(id=question_id).exists():
+            raise Question.DoesNotExist
         
-        # Get CSV content
-        csv_content = output.getvalue()
+        # Streamed to disk, so the worker never holds the whole export
+        path = exports.write_file(question_id, fmt)
         
         # Log success
-        logger.info(f"Successfully exported data for question {question_id}")
+        logger.info(f"Successfully exported data for question {question_id} to {path}")
         
-        return csv_content
+        return path
         
     except Question.DoesNotExist:
         logger.error(f"Question {question_id} not found")
         return f"Question {question_id} not found"
     except Exception as e:
         logger.error(f"Error exporting poll data for question {question_id}: {str(e)}")
-        return f"Error: {str(e)}" 
\ No newline at end of file
+        return f"Error: {str(e)}"
@@ -1,9 +1,31 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, override_settings, skipUnlessDBFeature
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.core.management import call_command
+from django.core.cache import cache, caches
+from unittest import mock
 from django.utils import timezone
-from django.urls import reverse
+from django.urls import clear_url_caches, resolve, reverse
 from django.contrib.auth.models import User
+from asgiref.sync import sync_to_async
+from rest_framework.authtoken.models import Token
+import asyncio
 import datetime
-from .models import Question, Choice, UserResponse
+import importlib
+from .models import Question, Choice, UserResponse, QuestionAnalytics, VoteEvent
+from . import chart_renderer, charts, services, vote_buffer, vote_events
+from . import bulk, cache_versions, exports, idempotency, live, ratelimit, read_cache, startup, tasks, user_votes
+from .cache_backends import TieredCache
+from . import urls as polls_urls
+from mysite import urls as mysite_urls
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from xml.etree import ElementTree
 
 
 class QuestionModelTests(TestCase):
@@ -145,6 +167,1397 @@ class UserResponseTests(TestCase):
         self.assertEqual(self.choice2.votes, 1)
 
 
+@override_settings(
+    POLLS_VOTE_INGESTION='buffered',
+    POLLS_VOTE_BUFFER={'FLUSH_THRESHOLD': 100, 'FLUSH_INTERVAL': 3600},
+)
+class VoteBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        vote_buffer.cache.clear()
+        self.user = User.objects.create_user(username='buffered', password='testpassword123')
+        self.question = Question.objects.create(question_text="Buffered", pub_date=timezone.now())
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1", votes=3)
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2", votes=0)
+        self.client = Client()
+        self.client.login(username='buffered', password='testpassword123')
+
+    def vote(self, choice):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+
+    def test_votes_are_buffered_until_flush(self):
+        """
+        Buffered votes don't touch Choice.votes until the buffer is flushed
+        """
+        self.vote(self.choice1)
+        self.vote(self.choice2)
+
+        self.choice1.refresh_from_db()
+        self.assertEqual(self.choice1.votes, 3)
+        self.assertEqual(
+            vote_buffer.pending_deltas([self.choice1.id, self.choice2.id]),
+            {self.choice2.id: 1},
+        )
+
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (3, 1))
+        self.assertEqual(vote_buffer.pending_deltas([self.choice1.id, self.choice2.id]), {})
+
+    def test_results_include_pending_deltas(self):
+        """
+        The results page combines persisted counts with unflushed deltas
+        """
+        self.vote(self.choice1)
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['total_votes'], 4)
+
+    def test_results_read_between_commit_callbacks(self):
+        """
+        A results read while the post-commit callbacks run can't cache counts
+        without the vote under the version the last callback leaves behind
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            services.cast_vote(self.user, self.question.id, self.choice2.id)
+        for callback in callbacks:
+            callback()
+            self.client.get(reverse('polls:results', args=(self.question.id,)))
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertEqual(response.context['total_votes'], 4)
+
+    def test_lost_journal_entry_does_not_block_flushes(self):
+        """
+        A journal slot that stays empty past JOURNAL_GRACE is skipped, and its
+        choice is still flushed and journaled again afterwards
+        """
+        self.vote(self.choice2)
+        vote_buffer.cache.delete(vote_buffer.JOURNAL_KEY.format(1))
+        User.objects.create_user(username='other', password='testpassword123')
+        self.client.login(username='other', password='testpassword123')
+        self.vote(self.choice1)
+
+        self.assertEqual(vote_buffer.flush(), 0)
+        with self.settings(POLLS_VOTE_BUFFER={'FLUSH_THRESHOLD': 100, 'FLUSH_INTERVAL': 3600, 'JOURNAL_GRACE': 0}):
+            self.assertEqual(vote_buffer.flush(), 2)
+        self.choice1.refresh_from_db()
+        self.choice2.refresh_from_db()
+        self.assertEqual((self.choice1.votes, self.choice2.votes), (4, 1))
+
+        User.objects.create_user(username='third', password='testpassword123')
+        self.client.login(username='third', password='testpassword123')
+        self.vote(self.choice2)
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.choice2.refresh_from_db()
+        self.assertEqual(self.choice2.votes, 2)
+
+    def test_deltas_survive_unrelated_cache_writes(self):
+        self.vote(self.choice2)
+        for i in range(400):
+            cache.set(f'unrelated:{i}', i)
+        self.assertEqual(vote_buffer.pending_deltas([self.choice2.id]), {self.choice2.id: 1})
+
+    def test_flush_on_threshold(self):
+        """
+        Reaching FLUSH_THRESHOLD pending deltas flushes inline
+        """
+        with self.settings(POLLS_VOTE_BUFFER={'FLUSH_THRESHOLD': 1, 'FLUSH_INTERVAL': 3600}):
+            self.vote(self.choice2)
+        self.choice2.refresh_from_db()
+        self.assertEqual(self.choice2.votes, 1)
+
+
+class QuestionAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='analytics', password='testpassword123')
+        self.question = Question.objects.create(question_text="Analytics", pub_date=timezone.now())
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        self.client = Client()
+        self.client.login(username='analytics', password='testpassword123')
+
+    def vote(self, choice):
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': choice.id})
+
+    def test_analytics_created_with_question(self):
+        analytics = QuestionAnalytics.objects.get(question=self.question)
+        self.assertEqual(analytics.total_votes, 0)
+        self.assertIsNone(analytics.last_vote_date)
+
+    def test_votes_update_analytics_by_delta(self):
+        """
+        A new vote adds one to total_votes, a changed vote only moves last_vote_date
+        """
+        self.vote(self.choice1)
+        analytics = QuestionAnalytics.objects.get(question=self.question)
+        self.assertEqual(analytics.total_votes, 1)
+        first_vote_date = analytics.last_vote_date
+        self.assertIsNotNone(first_vote_date)
+
+        self.vote(self.choice2)
+        analytics.refresh_from_db()
+        self.assertEqual(analytics.total_votes, 1)
+        self.assertGreaterEqual(analytics.last_vote_date, first_vote_date)
+
+    def test_update_analytics_repairs_drift(self):
+        self.vote(self.choice1)
+        QuestionAnalytics.objects.filter(question=self.question).update(total_votes=42)
+        analytics = QuestionAnalytics.objects.get(question=self.question)
+        analytics.update_analytics()
+        self.assertEqual(analytics.total_votes, 1)
+
+
+class VoteServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='voter', password='testpassword123')
+        self.question = Question.objects.create(question_text="Service", pub_date=timezone.now())
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+
+    def assertVotes(self, *expected):
+        self.assertEqual(
+            list(Choice.objects.filter(question=self.question).order_by('pk').values_list('votes', flat=True)),
+            list(expected),
+        )
+
+    def test_new_vote_queries(self):
+        # Savepoint + select, insert, event insert, choice update, analytics update
+        with self.assertNumQueries(7):
+            outcome = services.cast_vote(self.user, self.question.id, self.choice1.id)
+        self.assertEqual(outcome, services.VOTE_CREATED)
+        self.assertVotes(1, 0)
+
+    def test_changed_vote_queries(self):
+        services.cast_vote(self.user, self.question.id, self.choice1.id)
+        # Savepoint + select, response update, event insert, one update for both
+        # choices, analytics update
+        with self.assertNumQueries(7):
+            outcome = services.cast_vote(self.user, self.question.id, self.choice2.id)
+        self.assertEqual(outcome, services.VOTE_CHANGED)
+        self.assertVotes(0, 1)
+        self.assertEqual(UserResponse.objects.get(user=self.user).choice, self.choice2)
+
+    def test_unchanged_vote_queries(self):
+        services.cast_vote(self.user, self.question.id, self.choice1.id)
+        with self.assertNumQueries(3):
+            outcome = services.cast_vote(self.user, self.question.id, self.choice1.id)
+        self.assertEqual(outcome, services.VOTE_UNCHANGED)
+        self.assertVotes(1, 0)
+
+    def test_api_vote_does_not_lose_updates(self):
+        """
+        The API path no longer saves stale Choice instances over concurrent votes
+        """
+        other = User.objects.create_user(username='other', password='testpassword123')
+        Choice.objects.filter(pk=self.choice1.pk).update(votes=5)
+        client = Client()
+        for username in ('voter', 'other'):
+            client.login(username=username, password='testpassword123')
+            response = client.post(
+                f'/api/questions/{self.question.id}/vote/', {'choice': self.choice1.id}
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertVotes(7, 0)
+
+    def test_api_vote_rejects_non_integer_choice(self):
+        client = Client()
+        client.login(username='voter', password='testpassword123')
+        response = client.post(f'/api/questions/{self.question.id}/vote/', {'choice': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('choice', response.json())
+        self.assertVotes(0, 0)
+
+
+@override_settings(POLLS_VOTE_EVENTS={'CHUNK_SIZE': 2, 'SETTLE_SECONDS': 0})
+class VoteEventTests(TestCase):
+    def setUp(self):
+        self.question = Question.objects.create(question_text="Events", pub_date=timezone.now())
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        self.users = [User.objects.create_user(username=f'eventvoter{i}') for i in range(3)]
+
+    def votes(self):
+        return [c.votes for c in Choice.objects.filter(question=self.question).order_by('pk')]
+
+    def test_vote_changes_keep_history(self):
+        services.cast_vote(self.users[0], self.question.id, self.choice1.id)
+        services.cast_vote(self.users[0], self.question.id, self.choice2.id)
+        history = list(VoteEvent.objects.order_by('pk').values_list('choice_id', 'previous_choice_id'))
+        self.assertEqual(history, [(self.choice1.id, None), (self.choice2.id, self.choice1.id)])
+
+    @override_settings(POLLS_VOTE_INGESTION='events')
+    def test_compaction_folds_deferred_events_in_chunks(self):
+        for user in self.users:
+            services.cast_vote(user, self.question.id, self.choice1.id)
+        services.cast_vote(self.users[0], self.question.id, self.choice2.id)
+
+        self.assertEqual(self.votes(), [0, 0])
+        self.assertEqual(
+            services.apply_pending_votes(list(Choice.objects.filter(question=self.question).order_by('pk')))[0].votes,
+            2,
+        )
+
+        self.assertEqual(vote_events.compact(), 4)
+        self.assertEqual(self.votes(), [2, 1])
+        analytics = QuestionAnalytics.objects.get(question=self.question)
+        self.assertEqual(analytics.total_votes, 3)
+        self.assertIsNotNone(analytics.last_vote_date)
+        self.assertEqual(vote_events.high_water_mark(), VoteEvent.objects.latest('pk').pk)
+
+        # Only events after the high-water mark are read on the next run
+        self.assertEqual(vote_events.compact(), 0)
+        self.assertEqual(self.votes(), [2, 1])
+
+    @override_settings(POLLS_VOTE_INGESTION='events', POLLS_VOTE_EVENTS={'CHUNK_SIZE': 10, 'SETTLE_SECONDS': 60})
+    def test_compaction_stops_before_unsettled_event(self):
+        """
+        An unsettled event with a lower pk than settled ones holds back the
+        high-water mark until it settles
+        """
+        for user in self.users:
+            services.cast_vote(user, self.question.id, self.choice1.id)
+        first, unsettled, last = VoteEvent.objects.order_by('pk').values_list('pk', flat=True)
+        settled_date = timezone.now() - datetime.timedelta(minutes=5)
+        VoteEvent.objects.filter(pk__in=[first, last]).update(event_date=settled_date)
+
+        self.assertEqual(vote_events.compact(), 1)
+        self.assertEqual(vote_events.high_water_mark(), first)
+        self.assertEqual(self.votes(), [1, 0])
+
+        VoteEvent.objects.filter(pk=unsettled).update(event_date=settled_date)
+        self.assertEqual(vote_events.compact(), 2)
+        self.assertEqual(self.votes(), [3, 0])
+
+    def test_compaction_skips_events_counted_synchronously(self):
+        services.cast_vote(self.users[0], self.question.id, self.choice1.id)
+        self.assertEqual(vote_events.compact(), 1)
+        self.assertEqual(self.votes(), [1, 0])
+
+
+class VoteBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='kiosk', password='testpassword123')
+        self.questions = []
+        for i in range(3):
+            question = Question.objects.create(question_text=f"Batch {i}", pub_date=timezone.now())
+            Choice.objects.create(question=question, choice_text="A")
+            Choice.objects.create(question=question, choice_text="B")
+            self.questions.append(question)
+        self.client = Client()
+        self.client.login(username='kiosk', password='testpassword123')
+
+    def post_batch(self, votes):
+        return self.client.post(
+            '/api/questions/vote-batch/',
+            {'votes': [{'question': q, 'choice': c} for q, c in votes]},
+            content_type='application/json',
+        )
+
+    def test_batch_reports_status_per_vote(self):
+        q0, q1, q2 = self.questions
+        a0, b0 = q0.choice_set.order_by('pk')
+        a1, b1 = q1.choice_set.order_by('pk')
+        a2 = q2.choice_set.order_by('pk').first()
+        services.cast_vote(self.user, q0.id, a0.id)
+        services.cast_vote(self.user, q1.id, a1.id)
+
+        response = self.post_batch([
+            (q0.id, b0.id),  # changed
+            (q1.id, a1.id),  # unchanged
+            (q2.id, a2.id),  # created
+            (q2.id, a2.id),  # duplicate
+            (q0.id, a2.id),  # choice from another question
+        ])
+        self.assertEqual(response.status_code, 200)
+        statuses = [item['status'] for item in response.json()['results']]
+        self.assertEqual(statuses, ['changed', 'unchanged', 'created', 'error', 'error'])
+
+        a0.refresh_from_db()
+        b0.refresh_from_db()
+        a2.refresh_from_db()
+        self.assertEqual((a0.votes, b0.votes, a2.votes), (0, 1, 1))
+        self.assertEqual(UserResponse.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(QuestionAnalytics.objects.get(question=q2).total_votes, 1)
+
+    def test_batch_query_count_does_not_grow_with_size(self):
+        votes = [(q.id, q.choice_set.order_by('pk').first().id) for q in self.questions]
+        services.cast_vote(self.user, votes[0][0], votes[0][1])
+        self.post_batch(votes[:1])
+
+        switched = [(q.id, q.choice_set.order_by('pk').last().id) for q in self.questions]
+        with CaptureQueriesContext(connection) as small:
+            self.post_batch(switched[:1])
+        with CaptureQueriesContext(connection) as large:
+            self.post_batch(switched)
+        # Allow for a batch that both inserts and updates responses
+        self.assertLessEqual(len(large.captured_queries) - len(small.captured_queries), 1)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='mobile', password='testpassword123')
+        self.question = Question.objects.create(question_text="Retry", pub_date=timezone.now())
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Choice 2")
+        self.client = Client()
+        self.client.login(username='mobile', password='testpassword123')
+        self.url = f'/api/questions/{self.question.id}/vote/'
+
+    def post(self, choice, key='retry-1'):
+        return self.client.post(self.url, {'choice': choice.id}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response(self):
+        first = self.post(self.choice1)
+        self.assertEqual(first.json(), {'detail': 'Your vote has been recorded'})
+
+        with CaptureQueriesContext(connection) as queries:
+            replay = self.post(self.choice1)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay[idempotency.REPLAYED_HEADER], 'true')
+        self.assertFalse(any('polls_' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(VoteEvent.objects.count(), 1)
+
+    def test_key_reused_for_different_request(self):
+        self.post(self.choice1)
+        response = self.post(self.choice2)
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(POLLS_IDEMPOTENCY={'WAIT': 0})
+    def test_concurrent_duplicate_is_rejected(self):
+        # Simulate the first request still running
+        result_key, lock_key = idempotency.cache_keys(self.user.pk, self.url, 'in-flight')
+        cache.add(lock_key, 1)
+        response = self.post(self.choice1, key='in-flight')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(UserResponse.objects.exists())
+
+
+@override_settings(POLLS_RATE_LIMITS={'vote': '2/m'})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='flooder', password='testpassword123')
+        self.question = Question.objects.create(question_text="Flood", pub_date=timezone.now())
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice")
+        self.client = Client()
+        self.client.login(username='flooder', password='testpassword123')
+
+    def test_web_vote_rejected_over_rate(self):
+        url = reverse('polls:vote', args=(self.question.id,))
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {'choice': self.choice.id}).status_code, 302)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertFalse(any('polls_' in query['sql'] for query in queries.captured_queries))
+
+    def test_api_vote_shares_the_bucket(self):
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        url = f'/api/questions/{self.question.id}/vote/'
+        self.assertEqual(self.client.post(url, {'choice': self.choice.id}).status_code, 200)
+        response = self.client.post(url, {'choice': self.choice.id})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_bucket_refills_continuously(self):
+        """
+        A full bucket allows a burst of capacity, then one token per refill
+        interval, with no extra burst at minute boundaries
+        """
+        bucket = ratelimit.TokenBucket('vote', '2/m')
+        now = 1000 * 60 - 1
+        with mock.patch('polls.ratelimit.time.time', side_effect=lambda: now):
+            self.assertEqual([bucket.consume('client')[0] for _ in range(3)], [True, True, False])
+            self.assertEqual(bucket.consume('client'), (False, 30))
+            # Across the minute boundary nothing has refilled yet
+            now += 2
+            self.assertEqual(bucket.consume('client'), (False, 28))
+            now += 28
+            self.assertEqual([bucket.consume('client')[0] for _ in range(2)], [True, False])
+            # Idle time refills no more than capacity
+            now += 600
+            self.assertEqual([bucket.consume('client')[0] for _ in range(3)], [True, True, False])
+
+    def test_taking_a_token_is_one_cache_call(self):
+        bucket = ratelimit.TokenBucket('vote', '30/m')
+        now = 1000 * 60 + 1
+        with mock.patch('polls.ratelimit.time.time', side_effect=lambda: now), \
+                mock.patch('polls.ratelimit.cache', wraps=cache) as bucket_cache:
+            self.assertEqual(bucket.consume('client'), (True, 0))
+            bucket_cache.reset_mock()
+            for _ in range(5):
+                now += 1
+                self.assertEqual(bucket.consume('client'), (True, 0))
+        self.assertEqual([name for name, _args, _kwargs in bucket_cache.method_calls], ['incr'] * 5)
+
+    def test_unconfigured_scope_is_not_limited(self):
+        url = '/api/questions/vote-batch/'
+        payload = {'votes': [{'question': self.question.id, 'choice': self.choice.id}]}
+        for _ in range(3):
+            response = self.client.post(url, payload, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+
+@override_settings(POLLS_CHART_RENDERER={'MODE': 'inline'})
+class ResultsChartCacheTests(TestCase):
+    def setUp(self):
+        caches[charts.CHART_CACHE_ALIAS].clear()
+        self.question = Question.objects.create(question_text="Chart", pub_date=timezone.now())
+        Choice.objects.create(question=self.question, choice_text="Choice 1", votes=2)
+        Choice.objects.create(question=self.question, choice_text="Choice 2", votes=1)
+
+    def chart(self):
+        return chart_renderer.get_chart(self.question, list(self.question.choice_set.order_by('pk')))
+
+    def test_chart_rendered_again_only_after_counts_change(self):
+        with mock.patch.object(charts, 'render_chart', wraps=charts.render_chart) as render:
+            first = self.chart()
+            self.assertEqual(self.chart(), first)
+            self.assertEqual(render.call_count, 1)
+
+            Choice.objects.filter(question=self.question, choice_text="Choice 2").update(votes=5)
+            self.chart()
+            self.assertEqual(render.call_count, 2)
+        self.assertTrue(first.startswith(b'\x89PNG'))
+
+    @override_settings(POLLS_CHART_CACHE_MAX_BYTES=10)
+    def test_oversized_charts_are_not_cached(self):
+        with mock.patch.object(charts, 'render_chart', wraps=charts.render_chart) as render:
+            self.chart()
+            self.chart()
+            self.assertEqual(render.call_count, 2)
+
+
+class ChartRendererTests(TestCase):
+    def setUp(self):
+        caches[charts.CHART_CACHE_ALIAS].clear()
+        self.question = Question.objects.create(question_text="Pool", pub_date=timezone.now())
+        self.choices = [Choice.objects.create(question=self.question, choice_text="Only", votes=1)]
+
+    @override_settings(POLLS_CHART_RENDERER={'MODE': 'process', 'WORKERS': 1})
+    def test_renders_in_process_pool(self):
+        # The request doesn't wait; the pool fills the cache for a later one
+        self.assertIsNone(chart_renderer.get_chart(self.question, self.choices, 'png'))
+        key = charts.chart_cache_key(self.question, self.choices, 'png')
+        deadline = time.monotonic() + 60
+        while charts.get_cached_chart(key) is None and time.monotonic() < deadline:
+            time.sleep(0.1)
+        image = chart_renderer.get_chart(self.question, self.choices, 'png')
+        self.assertTrue(image.startswith(b'\x89PNG'))
+
+    @override_settings(POLLS_CHART_RENDERER={'MODE': 'process', 'WORKERS': 1})
+    def test_uncached_chart_falls_back(self):
+        response = self.client.get(reverse('polls:results_chart', args=(self.question.id, 'png')))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(POLLS_CHART_RENDERER={'MODE': 'celery'})
+    def test_celery_renders_are_queued_once(self):
+        with mock.patch.object(tasks.render_results_chart, 'delay') as delay:
+            self.assertIsNone(chart_renderer.get_chart(self.question, self.choices, 'png'))
+            self.assertIsNone(chart_renderer.get_chart(self.question, self.choices, 'png'))
+        self.assertEqual(delay.call_count, 1)
+
+        # What the worker does with the queued job
+        tasks.render_results_chart(*delay.call_args.args)
+        self.assertTrue(chart_renderer.get_chart(self.question, self.choices, 'png').startswith(b'\x89PNG'))
+        key = charts.chart_cache_key(self.question, self.choices, 'png')
+        self.assertIsNone(caches[charts.CHART_CACHE_ALIAS].get(chart_renderer.rendering_key(key)))
+
+
+class SVGChartBackendTests(TestCase):
+    def render(self, labels, values):
+        spec = {'title': 'Results: Test', 'labels': labels, 'values': values, 'fmt': 'svg', 'backend': 'svg'}
+        return charts.render_chart(spec)
+
+    def test_renders_valid_svg(self):
+        image = self.render(['Jordan', 'LeBron & Kobe <3'], [3, 1])
+        root = ElementTree.fromstring(image)
+        self.assertEqual(root.tag, '{http://www.w3.org/2000/svg}svg')
+        texts = [element.text for element in root.iter('{http://www.w3.org/2000/svg}text')]
+        self.assertIn('LeBron & Kobe <3', texts)
+        self.assertIn('3 (75.0%)', texts)
+        self.assertIn('1 (25.0%)', texts)
+
+    def test_no_votes(self):
+        root = ElementTree.fromstring(self.render(['A', 'B'], [0, 0]))
+        texts = [element.text for element in root.iter('{http://www.w3.org/2000/svg}text')]
+        self.assertEqual(texts.count('0 (0%)'), 2)
+
+    def test_bar_colors_match_viridis_range(self):
+        colors = charts.bar_colors(5)
+        self.assertEqual(colors[0], charts.viridis(0.1))
+        self.assertEqual(colors[-1], charts.viridis(0.9))
+        self.assertEqual(charts.viridis(0), '#440154')
+        self.assertEqual(charts.viridis(1), '#fde725')
+
+    def test_default_backends(self):
+        self.assertEqual(charts.get_backend('svg').name, 'svg')
+        self.assertEqual(charts.get_backend('png').name, 'matplotlib')
+
+    @override_settings(POLLS_CHART_BACKENDS={'svg': 'matplotlib'})
+    def test_backend_is_part_of_cache_key(self):
+        question = Question(pk=1, question_text="Key")
+        self.assertIn(':svg:matplotlib:', charts.chart_cache_key(question, [], 'svg'))
+
+
+class ResultsChartViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches[charts.CHART_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username='viewer', password='testpassword123')
+        self.question = Question.objects.create(question_text="Chart view", pub_date=timezone.now())
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice 1")
+        self.url = reverse('polls:results_chart', args=(self.question.id, 'png'))
+
+    def test_results_page_links_to_chart(self):
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        svg_url = reverse('polls:results_chart', args=(self.question.id, 'svg'))
+        self.assertContains(response, f'src="{svg_url}"')
+        self.assertNotContains(response, 'data:image/png;base64')
+
+    @override_settings(POLLS_CHART_RENDERER={'MODE': 'inline'})
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        services.cast_vote(self.user, self.question.id, self.choice.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_svg_chart(self):
+        response = self.client.get(reverse('polls:results_chart', args=(self.question.id, 'svg')))
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
+
+
+class ResultsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = Question.objects.create(question_text="Cached results", pub_date=timezone.now())
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="First")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Second")
+        self.alice = User.objects.create_user(username='alice', password='testpassword123')
+        self.bob = User.objects.create_user(username='bob', password='testpassword123')
+        self.url = reverse('polls:results', args=(self.question.id,))
+
+    def test_vote_invalidates_results(self):
+        self.assertContains(self.client.get(self.url), 'First — 0 votes')
+        self.client.login(username='alice', password='testpassword123')
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice1.id})
+        self.assertContains(self.client.get(self.url), 'First — 1 vote')
+
+    def test_user_vote_is_not_shared(self):
+        self.client.login(username='alice', password='testpassword123')
+        self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice1.id})
+        self.assertContains(self.client.get(self.url), 'You voted for: <strong>First</strong>')
+
+        self.client.login(username='bob', password='testpassword123')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'First — 1 vote')
+        self.assertNotContains(response, 'You voted for')
+
+    def test_cached_tallies_skip_choice_query(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_version_changes(self):
+        version = cache_versions.get_version(self.question.id)
+        self.assertEqual(cache_versions.get_version(self.question.id), version)
+        services.cast_vote(self.alice, self.question.id, self.choice1.id)
+        self.assertGreater(cache_versions.get_version(self.question.id), version)
+
+        version = cache_versions.get_version(self.question.id)
+        self.choice2.choice_text = "Renamed"
+        self.choice2.save()
+        self.assertNotEqual(cache_versions.get_version(self.question.id), version)
+
+    def test_evicted_version_is_not_reused(self):
+        key = cache_versions.versioned_key('results', self.question.id)
+        cache.delete(cache_versions.VERSION_KEY.format(self.question.id))
+        self.assertNotEqual(cache_versions.versioned_key('results', self.question.id), key)
+
+
+class ReadThroughCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_index_caches_compact_values(self):
+        Question.objects.create(question_text="Cached", pub_date=timezone.now(), category="NBA")
+        self.client.get(reverse('polls:index'))
+        value, delta, expires = cache.get('index:latest_questions')
+        self.assertEqual(value[0]['question_text'], "Cached")
+        self.assertIsInstance(value, list)
+        self.assertEqual(cache.get('index:category_counts')[0], [{'category': 'NBA', 'count': 1}])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, "Cached")
+
+    def test_fresh_entry_is_not_recomputed(self):
+        compute = mock.Mock(return_value=[1])
+        read_cache.get_or_compute('key', compute, 60)
+        self.assertEqual(read_cache.get_or_compute('key', compute, 60), [1])
+        self.assertEqual(compute.call_count, 1)
+
+    def test_early_refresh(self):
+        cache.set('key', (['old'], 1.0, time.time() + 5), 60)
+        # A draw this unlucky refreshes an entry that still has 5 seconds left
+        with mock.patch('polls.read_cache.random.random', return_value=0.999999):
+            self.assertEqual(read_cache.get_or_compute('key', lambda: ['new'], 60), ['new'])
+
+    def test_single_flight_refresh_serves_stale_value(self):
+        cache.set('key', (['old'], 1.0, time.time() - 1), 60)
+        cache.add('key:refresh', 1)
+        compute = mock.Mock(return_value=['new'])
+        self.assertEqual(read_cache.get_or_compute('key', compute, 60), ['old'])
+        compute.assert_not_called()
+
+    @override_settings(POLLS_READ_CACHE={'WAIT': 0})
+    def test_miss_with_stuck_lock_computes(self):
+        cache.add('key:refresh', 1)
+        self.assertEqual(read_cache.get_or_compute('key', lambda: ['new'], 60), ['new'])
+
+
+class TieredCacheTests(TestCase):
+    """Two workers sharing one 'shared' cache, which stands in for Redis"""
+
+    def setUp(self):
+        caches['shared'].clear()
+        options = {'SHARED': 'shared', 'L1_PREFIXES': ['results:'], 'L1_TIMEOUT': 60}
+        self.worker_a = TieredCache('worker-a', {'OPTIONS': options})
+        self.worker_b = TieredCache('worker-b', {'OPTIONS': options})
+        self.worker_a.clear_local()
+        self.worker_b.clear_local()
+
+    def test_local_tier_serves_repeat_reads(self):
+        self.worker_a.set('results:1:v1', {'total_votes': 3})
+        self.assertEqual(self.worker_b.get('results:1:v1'), {'total_votes': 3})
+        with mock.patch.object(caches['shared'], 'get', side_effect=AssertionError):
+            self.assertEqual(self.worker_b.get('results:1:v1'), {'total_votes': 3})
+
+    def test_other_keys_always_read_shared_tier(self):
+        self.worker_a.set('question_version:1', 1)
+        self.assertEqual(self.worker_b.get('question_version:1'), 1)
+        self.worker_a.incr('question_version:1')
+        self.assertEqual(self.worker_b.get('question_version:1'), 2)
+
+    def test_version_bump_reaches_other_workers(self):
+        with mock.patch.object(cache_versions, 'cache', self.worker_a):
+            key = cache_versions.versioned_key('results', 1)
+            self.worker_a.set(key, 'old tallies')
+        with mock.patch.object(cache_versions, 'cache', self.worker_b):
+            self.assertEqual(self.worker_b.get(cache_versions.versioned_key('results', 1)), 'old tallies')
+        with mock.patch.object(cache_versions, 'cache', self.worker_a):
+            cache_versions.bump([1])
+        with mock.patch.object(cache_versions, 'cache', self.worker_b):
+            self.assertIsNone(self.worker_b.get(cache_versions.versioned_key('results', 1)))
+
+    def test_delete_clears_both_tiers(self):
+        self.worker_a.set('results:1:v1', 'tallies')
+        self.worker_a.delete('results:1:v1')
+        self.assertIsNone(self.worker_a.get('results:1:v1'))
+        self.assertIsNone(caches['shared'].get('results:1:v1'))
+
+
+class UserVotesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='badges', password='testpassword123')
+        self.questions = [
+            Question.objects.create(question_text=f"Question {i}", pub_date=timezone.now(), category="NBA")
+            for i in range(3)
+        ]
+        self.choices = [Choice.objects.create(question=question, choice_text="Yes") for question in self.questions]
+        UserResponse.objects.create(user=self.user, question=self.questions[0], choice=self.choices[0])
+        self.client.login(username='badges', password='testpassword123')
+
+    def test_map_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(user_votes.voted_map(self.user), {self.questions[0].id: self.choices[0].id})
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            user_votes.voted_map(user)
+
+    def test_vote_updates_map(self):
+        user_votes.voted_map(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.cast_vote(self.user, self.questions[1].id, self.choices[1].id)
+        self.assertEqual(user_votes.voted_map(User.objects.get(pk=self.user.pk)), {
+            self.questions[0].id: self.choices[0].id,
+            self.questions[1].id: self.choices[1].id,
+        })
+
+    def test_load_racing_a_vote_is_not_kept(self):
+        """
+        A map loaded before a vote committed but stored after it isn't read again
+        """
+        stale_key = user_votes.voted_key(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.cast_vote(self.user, self.questions[1].id, self.choices[1].id)
+        cache.set(stale_key, {self.questions[0].id: (self.choices[0].id, timezone.now())})
+        self.assertIn(self.questions[1].id, user_votes.voted_map(User.objects.get(pk=self.user.pk)))
+
+    def test_pages_read_map_instead_of_responses(self):
+        with CaptureQueriesContext(connection) as queries:
+            for name, args in [('polls:detail', (self.questions[0].id,)), ('polls:results', (self.questions[0].id,)),
+                               ('polls:index', ()), ('polls:category', ('NBA',))]:
+                self.assertEqual(self.client.get(reverse(name, args=args)).status_code, 200)
+        # Only the first page loads the map
+        self.assertEqual(len([query for query in queries if 'polls_userresponse' in query['sql']]), 1)
+
+    def test_voted_badges(self):
+        response = self.client.get(reverse('polls:category', args=('NBA',)))
+        self.assertContains(response, '<span class="voted">Voted</span>', count=1)
+        response = self.client.get(reverse('polls:index'))
+        self.assertContains(response, '<span class="voted">Voted</span>', count=1)
+
+    def test_detail_shows_own_choice(self):
+        response = self.client.get(reverse('polls:detail', args=(self.questions[0].id,)))
+        self.assertContains(response, '<strong>Your choice:</strong> Yes')
+        self.assertContains(response, '<strong>Submitted:</strong>')
+        self.assertEqual(response.context['response_date'], UserResponse.objects.get(user=self.user).response_date)
+        response = self.client.get(reverse('polls:detail', args=(self.questions[1].id,)))
+        self.assertContains(response, 'Submit Answer')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='poller', password='testpassword123', is_staff=True)
+        self.question = Question.objects.create(question_text="Polled", pub_date=timezone.now(), author=self.user)
+        self.choice = Choice.objects.create(question=self.question, choice_text="Choice 1")
+
+    def assert_revalidates(self, url, queries, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_results(self):
+        url = reverse('polls:results', args=(self.question.id,))
+        etag = self.assert_revalidates(url, 1)
+        services.cast_vote(self.user, self.question.id, self.choice.id)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_results_etag_is_per_user(self):
+        url = reverse('polls:results', args=(self.question.id,))
+        etag = self.client.get(url)['ETag']
+        self.client.login(username='poller', password='testpassword123')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_question_retrieve(self):
+        url = reverse('polls:question-detail', args=(self.question.id,)) + '?expand=choices'
+        etag = self.assert_revalidates(url, 1, HTTP_ACCEPT='application/json')
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertIn('Last-Modified', response)
+
+        services.cast_vote(self.user, self.question.id, self.choice.id)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['choices'][0]['votes'], 1)
+
+    def test_question_list(self):
+        url = reverse('polls:question-list')
+        etag = self.assert_revalidates(url, 0, HTTP_ACCEPT='application/json')
+        Question.objects.create(question_text="New", pub_date=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_question(self):
+        url = reverse('polls:question-detail', args=(999,))
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='application/json').status_code, 404)
+        self.assertEqual(self.client.get(reverse('polls:results', args=(999,))).status_code, 404)
+
+    def test_analytics(self):
+        self.client.login(username='poller', password='testpassword123')
+        url = reverse('polls:analytics-list')
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT='application/json').status_code, 304)
+        services.cast_vote(self.user, self.question.id, self.choice.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT='application/json').status_code, 200)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        # Pairs share a pub_date so that the id tie-break matters
+        self.questions = [
+            Question.objects.create(question_text=f"Page {i}", pub_date=now - datetime.timedelta(hours=i // 2))
+            for i in range(7)
+        ]
+
+    def walk(self, url):
+        texts = []
+        while url:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200)
+            texts += [item['question_text'] for item in response.json()['results']]
+            url = response.json()['next']
+        return texts
+
+    def test_pages_cover_every_question_once(self):
+        texts = self.walk(reverse('polls:question-list') + '?page_size=2')
+        expected = [question.question_text for question in sorted(
+            self.questions, key=lambda question: (question.pub_date, question.id), reverse=True
+        )]
+        self.assertEqual(texts, expected)
+
+    def test_previous_link(self):
+        first = self.client.get(reverse('polls:question-list') + '?page_size=3').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_deep_page_uses_keyset_filter(self):
+        first = self.client.get(reverse('polls:question-list') + '?page_size=3').json()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first['next'])
+        sql = next(query['sql'] for query in queries if 'FROM "polls_question"' in query['sql'])
+        self.assertNotIn('OFFSET', sql)
+        self.assertIn('"pub_date" <', sql)
+
+    @override_settings(POLLS_API_PAGINATION={'PAGE_SIZE': 2, 'MAX_PAGE_SIZE': 3})
+    def test_page_size_limits(self):
+        url = reverse('polls:question-list')
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+        self.assertEqual(len(self.client.get(url + '?page_size=50').json()['results']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('polls:question-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_responses_are_paginated(self):
+        user = User.objects.create_user(username='pager', password='testpassword123')
+        for question in self.questions:
+            choice = Choice.objects.create(question=question, choice_text="Yes")
+            UserResponse.objects.create(user=user, question=question, choice=choice)
+        self.client.login(username='pager', password='testpassword123')
+        url = reverse('polls:response-list') + '?page_size=4'
+        page = self.client.get(url).json()
+        self.assertEqual(len(page['results']), 4)
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 3)
+
+
+class ApiQueryCountTests(TestCase):
+    """Every API list endpoint runs the same number of queries for 2 rows as for 10"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='counter', password='testpassword123', is_staff=True)
+        self.client.login(username='counter', password='testpassword123')
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            question = Question.objects.create(
+                question_text=f"Question {self.rows}", pub_date=timezone.now(), author=self.user
+            )
+            choices = [Choice.objects.create(question=question, choice_text=str(i)) for i in range(3)]
+            UserResponse.objects.create(user=self.user, question=question, choice=choices[0])
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        # Analytics are not paginated
+        return len(queries), len(data['results'] if isinstance(data, dict) else data)
+
+    def assert_constant_queries(self, url):
+        self.add_rows(2)
+        url += ('&' if '?' in url else '?') + 'page_size=100'
+        few, few_rows = self.count_queries(url)
+        self.add_rows(8)
+        many, many_rows = self.count_queries(url)
+        self.assertGreater(many_rows, few_rows)
+        self.assertEqual(many, few, f"{url} runs more queries as rows are added")
+
+    def test_questions(self):
+        self.assert_constant_queries(reverse('polls:question-list') + '?expand=choices')
+
+    def test_choices(self):
+        self.assert_constant_queries(reverse('polls:choice-list'))
+
+    def test_responses(self):
+        self.assert_constant_queries(reverse('polls:response-list'))
+
+    def test_analytics(self):
+        self.assert_constant_queries(reverse('polls:analytics-list'))
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='sparse', password='testpassword123')
+        self.question = Question.objects.create(
+            question_text="Sparse", pub_date=timezone.now(), category="NBA", author=self.user
+        )
+        self.choice = Choice.objects.create(question=self.question, choice_text="Yes")
+        UserResponse.objects.create(user=self.user, question=self.question, choice=self.choice)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_choices_are_opt_in(self):
+        data, queries = self.get(reverse('polls:question-list'))
+        self.assertNotIn('choices', data['results'][0])
+        self.assertFalse([sql for sql in queries if 'polls_choice' in sql])
+
+        data, queries = self.get(reverse('polls:question-list') + '?expand=choices')
+        self.assertEqual(data['results'][0]['choices'][0]['choice_text'], "Yes")
+        self.assertEqual(len(queries), 2)
+
+    def test_fields_limit_output_and_columns(self):
+        data, queries = self.get(reverse('polls:question-list') + '?fields=id,question_text')
+        self.assertEqual(set(data['results'][0]), {'id', 'question_text'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"category"', queries[0])
+        self.assertNotIn('auth_user', queries[0])
+
+        data, queries = self.get(reverse('polls:question-detail', args=(self.question.id,)) + '?fields=author_username')
+        self.assertEqual(data, {'author_username': 'sparse'})
+
+    def test_related_fields_are_joined_on_demand(self):
+        self.client.login(username='sparse', password='testpassword123')
+        data, queries = self.get(reverse('polls:response-list') + '?fields=id,choice_text')
+        self.assertEqual(data['results'], [{'id': UserResponse.objects.get().id, 'choice_text': "Yes"}])
+        sql = next(sql for sql in queries if 'FROM "polls_userresponse"' in sql)
+        self.assertIn('polls_choice', sql)
+        self.assertNotIn('polls_question', sql)
+
+
+class FastSerializationTests(TestCase):
+    """The values() fast path returns exactly what the model serializers do"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='fast', password='testpassword123')
+        self.client.login(username='fast', password='testpassword123')
+        for i in range(3):
+            question = Question.objects.create(
+                question_text=f"Fast {i}", pub_date=timezone.now(), category="NBA",
+                # One question without an author, which omits author_username
+                author=self.user if i else None
+            )
+            choices = [Choice.objects.create(question=question, choice_text=str(n), votes=n) for n in range(2)]
+            UserResponse.objects.create(user=self.user, question=question, choice=choices[i % 2])
+
+    def get_both(self, url):
+        responses = []
+        for enabled in (False, True):
+            with override_settings(POLLS_API_FAST_SERIALIZATION=enabled):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 200)
+            responses.append((response.content, len(queries)))
+        (regular, regular_queries), (fast, fast_queries) = responses
+        self.assertEqual(fast, regular)
+        self.assertLessEqual(fast_queries, regular_queries)
+        return fast
+
+    def test_questions(self):
+        content = self.get_both(reverse('polls:question-list'))
+        self.assertIn(b'"author_username":"fast"', content)
+        self.get_both(reverse('polls:question-list') + '?expand=choices')
+        self.get_both(reverse('polls:question-list') + '?fields=id,choices&expand=choices&ordering=category')
+
+    def test_pagination_cursors(self):
+        url = reverse('polls:question-list') + '?page_size=2'
+        self.get_both(url)
+        next_url = self.client.get(url, HTTP_ACCEPT='application/json').json()['next']
+        self.get_both(next_url)
+
+    def test_responses(self):
+        self.get_both(reverse('polls:response-list'))
+        self.get_both(reverse('polls:response-list') + '?fields=question_text,response_date')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='exporter', password='testpassword123', is_staff=True)
+        self.question = Question.objects.create(question_text="Export", pub_date=timezone.now())
+        choice = Choice.objects.create(question=self.question, choice_text="Jordan, Michael")
+        for i in range(5):
+            user = User.objects.create_user(username=f'voter{i}')
+            UserResponse.objects.create(user=user, question=self.question, choice=choice)
+
+    def test_csv_is_streamed_to_staff(self):
+        self.client.login(username='exporter', password='testpassword123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('polls:export', args=(self.question.id, 'csv')))
+            content = b''.join(response.streaming_content).decode()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'Username,Choice,Timestamp')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].startswith('voter0,"Jordan, Michael",'))
+        # The rows come from one joined query
+        self.assertEqual(len([query for query in queries if 'polls_userresponse' in query['sql']]), 1)
+
+    def test_ndjson(self):
+        self.client.login(username='exporter', password='testpassword123')
+        response = self.client.get(reverse('polls:export', args=(self.question.id, 'ndjson')))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['username'] for row in rows], [f'voter{i}' for i in range(5)])
+        self.assertEqual(rows[0]['choice'], "Jordan, Michael")
+
+    @override_settings(POLLS_EXPORT={'CHUNK_SIZE': 2})
+    async def test_streamed_asynchronously_under_asgi(self):
+        await self.async_client.alogin(username='exporter', password='testpassword123')
+        response = await self.async_client.get(reverse('polls:export', args=(self.question.id, 'ndjson')))
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['username'], 'voter0')
+
+    def test_requires_staff(self):
+        User.objects.create_user(username='plain', password='testpassword123')
+        self.client.login(username='plain', password='testpassword123')
+        response = self.client.get(reverse('polls:export', args=(self.question.id, 'csv')))
+        self.assertRedirects(response, reverse('polls:index'))
+
+    def test_task_writes_a_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(POLLS_EXPORT={'CHUNK_SIZE': 2, 'DIRECTORY': directory}):
+                path = tasks.export_poll_data(self.question.id)
+            self.assertEqual(os.path.dirname(path), directory)
+            with open(path, newline='') as export:
+                self.assertEqual(export.read(), ''.join(exports.stream(self.question.id, 'csv')))
+            self.assertEqual(os.listdir(directory), [os.path.basename(path)])
+
+
+class BulkQuestionCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='importer', password='testpassword123')
+        self.client.login(username='importer', password='testpassword123')
+
+    def payload(self, count):
+        return [
+            {
+                'question_text': f"Imported {i}",
+                'pub_date': timezone.now().isoformat(),
+                'category': 'NBA',
+                'choices': [{'choice_text': f"Choice {n}"} for n in range(4)],
+            }
+            for i in range(count)
+        ]
+
+    def post_bulk(self, count):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('polls:question-bulk-create'), self.payload(count), content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 201)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT')]
+        return response.json(), len(queries), len(inserts)
+
+    def test_bulk_creates_questions_choices_and_analytics(self):
+        data, _queries, inserts = self.post_bulk(3)
+        self.assertEqual([item['question_text'] for item in data], ["Imported 0", "Imported 1", "Imported 2"])
+        self.assertEqual([choice['choice_text'] for choice in data[0]['choices']], [f"Choice {n}" for n in range(4)])
+        self.assertEqual(data[0]['author_username'], 'importer')
+        self.assertEqual(Choice.objects.count(), 12)
+        self.assertEqual(QuestionAnalytics.objects.count(), 3)
+        self.assertEqual(inserts, 3)
+
+    def test_statements_do_not_grow_with_questions(self):
+        _data, few, _inserts = self.post_bulk(2)
+        _data, many, inserts = self.post_bulk(40)
+        self.assertEqual(many, few)
+        self.assertEqual(inserts, 3)
+
+    def test_single_create_with_nested_choices(self):
+        payload = self.payload(1)[0]
+        response = self.client.post(reverse('polls:question-list'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        question = Question.objects.get(pk=response.json()['id'])
+        self.assertEqual(question.choice_set.count(), 4)
+        self.assertEqual(question.author, self.user)
+        self.assertTrue(QuestionAnalytics.objects.filter(question=question).exists())
+
+    def test_choices_cannot_be_replaced_on_update(self):
+        question, = bulk.create_questions(self.payload(1), author=self.user)
+        response = self.client.patch(
+            reverse('polls:question-detail', args=(question.id,)),
+            {'choices': [{'choice_text': "New"}]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(question.choice_set.count(), 4)
+
+    def test_add_nba_questions(self):
+        call_command('add_nba_questions', stdout=io.StringIO())
+        call_command('add_nba_questions', stdout=io.StringIO())
+        self.assertEqual(Question.objects.count(), 5)
+        self.assertEqual(Choice.objects.count(), 25)
+        self.assertEqual(QuestionAnalytics.objects.count(), 5)
+
+
+class LiveResultsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='watcher', password='testpassword123')
+        self.question = Question.objects.create(question_text="Live", pub_date=timezone.now())
+        self.choice1 = Choice.objects.create(question=self.question, choice_text="One")
+        self.choice2 = Choice.objects.create(question=self.question, choice_text="Two")
+
+    async def vote(self, username, choice):
+        user = await User.objects.acreate(username=username)
+        await sync_to_async(services.cast_vote)(user, self.question.id, choice.id)
+
+    async def test_votes_are_pushed_as_deltas(self):
+        hub = live.Hub()
+        subscription, snapshot = await hub.subscribe(self.question.id)
+        self.assertEqual(snapshot, {self.choice1.id: 0, self.choice2.id: 0})
+
+        await hub.poll()
+        self.assertEqual(await subscription.next(0), None)
+
+        await self.vote('voter1', self.choice1)
+        await hub.poll()
+        self.assertEqual(await subscription.next(0), {self.choice1.id: 1})
+        hub.unsubscribe(subscription)
+        self.assertEqual(hub.counts, {})
+
+    async def test_unread_deltas_are_coalesced(self):
+        hub = live.Hub()
+        subscription, _snapshot = await hub.subscribe(self.question.id)
+        await self.vote('voter1', self.choice1)
+        await hub.poll()
+        await self.vote('voter2', self.choice1)
+        await self.vote('voter3', self.choice2)
+        await hub.poll()
+        self.assertEqual(await subscription.next(0), {self.choice1.id: 2, self.choice2.id: 1})
+        hub.unsubscribe(subscription)
+
+    async def test_stream_under_asgi(self):
+        client = AsyncClient()
+        response = await client.get(reverse('polls:results_events', args=(self.question.id,)))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        first = await anext(stream)
+        self.assertIn(b'event: snapshot', first)
+        self.assertIn(f'"{self.choice1.id}":0'.encode(), first)
+        await response.streaming_content.aclose()
+
+        response = await client.get(reverse('polls:results_events', args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_poll_errors_do_not_stop_the_hub(self):
+        hub = live.Hub()
+        subscription, _snapshot = await hub.subscribe(self.question.id)
+        await self.vote('voter1', self.choice1)
+        poll = hub.poll
+        polls = []
+
+        async def fails_once():
+            polls.append(None)
+            if len(polls) == 1:
+                raise ConnectionError
+            await poll()
+
+        with self.settings(POLLS_LIVE={'MAX_RATE': 100}), \
+                mock.patch.object(hub, 'poll', fails_once), \
+                self.assertLogs('polls.live', 'ERROR'):
+            self.assertEqual(await subscription.next(5), {self.choice1.id: 1})
+        self.assertFalse(hub.task.done())
+        hub.unsubscribe(subscription)
+        await hub.task
+
+    def test_wsgi_tells_eventsource_to_stop(self):
+        url = reverse('polls:results_events', args=(self.question.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, b'')
+        self.assertFalse(any('polls_choice' in query['sql'] for query in queries.captured_queries))
+
+
+class AsyncViewTests(TestCase):
+    """The async read views, routed to as under mysite/asgi.py"""
+
+    @classmethod
+    def reload_urls(cls):
+        importlib.reload(polls_urls)
+        importlib.reload(mysite_urls)
+        clear_url_caches()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Cleanups run last in, first out: the setting is restored first
+        cls.addClassCleanup(cls.reload_urls)
+        cls.enterClassContext(override_settings(POLLS_ASYNC_VIEWS=True))
+        cls.reload_urls()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='async', password='testpassword123')
+        self.question = Question.objects.create(
+            question_text="Async?", pub_date=timezone.now(), category="NBA", author=self.user
+        )
+        self.choice = Choice.objects.create(question=self.question, choice_text="First")
+        Choice.objects.create(question=self.question, choice_text="Second")
+        services.cast_vote(self.user, self.question.id, self.choice.id)
+
+    def test_pages_are_async(self):
+        for name, args in [('index', ()), ('detail', (self.question.id,)),
+                           ('results', (self.question.id,)), ('category', ('NBA',))]:
+            func = resolve(reverse(f'polls:{name}', args=args)).func
+            self.assertTrue(asyncio.iscoroutinefunction(func), name)
+
+    async def test_pages(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('polls:index'))
+        self.assertContains(response, "Async?")
+        self.assertContains(response, 'class="voted"')
+
+        response = await self.async_client.get(reverse('polls:detail', args=(self.question.id,)))
+        self.assertContains(response, "Your choice:</strong> First")
+        self.assertContains(response, "Submitted:</strong>")
+
+        response = await self.async_client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, "First — 1 vote")
+        self.assertContains(response, "You voted for: <strong>First</strong>")
+        response = await self.async_client.get(
+            reverse('polls:results', args=(self.question.id,)), headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(reverse('polls:category', args=('NBA',)))
+        self.assertContains(response, "Async?")
+
+        response = await self.async_client.get(reverse('polls:detail', args=(999,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_api_matches_the_viewset(self):
+        # Token authenticated requests are handed to QuestionViewSet
+        token = Token.objects.create(user=self.user)
+        for url in [
+            reverse('polls:question-list'),
+            reverse('polls:question-list') + '?expand=choices&fields=id,choices&page_size=1',
+            reverse('polls:question-list') + '?search=Async',
+            reverse('polls:question-detail', args=(self.question.id,)) + '?expand=choices',
+        ]:
+            served = self.client.get(url, HTTP_ACCEPT='application/json')
+            handed_over = self.client.get(url, HTTP_ACCEPT='application/json', HTTP_AUTHORIZATION=f'Token {token.key}')
+            self.assertEqual(served.status_code, 200)
+            self.assertEqual(served.content, handed_over.content, url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=served['ETag']).status_code, 304)
+
+        response = self.client.get(reverse('polls:question-detail', args=(999,)), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_api_invalid_cursor(self):
+        token = await Token.objects.acreate(user=self.user)
+        for cursor in ['garbage', 'eyJyIjowLCJwIjpbImEiXX0=']:
+            url = reverse('polls:question-list') + f'?cursor={cursor}'
+            served = await self.async_client.get(url, headers={'Accept': 'application/json'})
+            handed_over = await self.async_client.get(
+                url, headers={'Accept': 'application/json', 'Authorization': f'Token {token.key}'}
+            )
+            self.assertEqual(served.status_code, 404, cursor)
+            self.assertEqual(served.content, handed_over.content, cursor)
+
+    def test_api_writes_and_browsable_api_use_the_viewset(self):
+        self.client.login(username='async', password='testpassword123')
+        response = self.client.post(reverse('polls:question-list'), {
+            'question_text': "Written", 'pub_date': timezone.now().isoformat(),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(reverse('polls:question-list'), HTTP_ACCEPT='text/html')
+        self.assertContains(response, "Django REST framework")
+
+
+class ConcurrentVoteTests(TransactionTestCase):
+    def test_lost_insert_race_is_retried(self):
+        """
+        A vote whose lookup ran before a concurrent request inserted the same
+        user's response hits the unique constraint and is retried against it
+        """
+        question = Question.objects.create(question_text="Race", pub_date=timezone.now())
+        choices = [Choice.objects.create(question=question, choice_text=str(i)) for i in range(2)]
+        user = User.objects.create_user(username='racer')
+        # The concurrent request, committed between the lookup and the insert
+        services.cast_vote(user, question.id, choices[0].id)
+
+        select_for_update = UserResponse.objects.select_for_update
+        lookups = []
+
+        def lookup_before_concurrent_insert(*args, **kwargs):
+            lookups.append(None)
+            if len(lookups) == 1:
+                return UserResponse.objects.none()
+            return select_for_update(*args, **kwargs)
+
+        with mock.patch.object(UserResponse.objects, 'select_for_update', lookup_before_concurrent_insert):
+            outcome = services.cast_vote(user, question.id, choices[1].id)
+
+        self.assertEqual(outcome, services.VOTE_CHANGED)
+        self.assertEqual(len(lookups), 2)
+        votes = Choice.objects.filter(question=question).order_by('pk').values_list('votes', flat=True)
+        self.assertEqual(list(votes), [0, 1])
+        self.assertEqual(UserResponse.objects.get(question=question).choice, choices[1])
+        self.assertEqual(QuestionAnalytics.objects.get(question=question).total_votes, 1)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_votes_are_all_counted(self):
+        question = Question.objects.create(question_text="Race", pub_date=timezone.now())
+        choices = [Choice.objects.create(question=question, choice_text=str(i)) for i in range(2)]
+        users = [User.objects.create_user(username=f'racer{i}') for i in range(8)]
+        barrier = threading.Barrier(len(users))
+
+        def run(user):
+            try:
+                barrier.wait()
+                # Every user votes, then half of them switch choices
+                services.cast_vote(user, question.id, choices[0].id)
+                if user.pk % 2:
+                    services.cast_vote(user, question.id, choices[1].id)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        votes = sorted(Choice.objects.filter(question=question).values_list('votes', flat=True))
+        self.assertEqual(sum(votes), len(users))
+        self.assertEqual(UserResponse.objects.filter(question=question).count(), len(users))
+        self.assertEqual(QuestionAnalytics.objects.get(question=question).total_votes, len(users))
+
+
 def create_question(question_text, days):
     """
     Create a question with the given `question_text` and published the
@@ -153,3 +1566,17 @@ def create_question(question_text, days):
     """
     time = timezone.now() + datetime.timedelta(days=days)
     return Question.objects.create(question_text=question_text, pub_date=time)
+
+
+class StartupImportTests(TestCase):
+    def test_wsgi_import_within_budget(self):
+        budget = settings.POLLS_IMPORT_BUDGET
+        profile = startup.profile_import('mysite.wsgi')
+        self.assertLessEqual(profile['seconds'], budget['SECONDS'])
+        self.assertLessEqual(len(profile['modules']), budget['MODULES'])
+        self.assertEqual(startup.heavy_modules(profile['modules']), [])
+
+    def test_celery_app_is_loaded_on_demand(self):
+        import mysite
+        from mysite.celery import app
+        self.assertIs(mysite.celery_app, app)
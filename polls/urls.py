@@ -1,9 +1,21 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
 
 from . import views
 from . import api_views
 
+# Async read views for ASGI deployments, see polls/async_views.py
+if settings.POLLS_ASYNC_VIEWS:
+    from . import async_views as read_views
+    async_api_urls = [
+        path('api/questions/', read_views.question_list),
+        path('api/questions/<int:pk>/', read_views.question_detail),
+    ]
+else:
+    read_views = views
+    async_api_urls = []
+
 # Create a router for API views
 router = DefaultRouter()
 router.register(r'questions', api_views.QuestionViewSet, basename='question')
@@ -17,15 +29,19 @@ urlpatterns = [
     path("vercel-test/", views.vercel_landing, name="vercel_landing"),
     
     # Standard web views
-    path("", views.index, name="index"),
-    path("<int:question_id>/", views.detail, name="detail"),
-    path("<int:question_id>/results/", views.results, name="results"),
+    path("", read_views.index, name="index"),
+    path("<int:question_id>/", read_views.detail, name="detail"),
+    path("<int:question_id>/results/", read_views.results, name="results"),
+    re_path(r"^(?P<question_id>[0-9]+)/results/chart\.(?P<fmt>png|svg)$", views.results_chart, name="results_chart"),
+    path("<int:question_id>/results/events/", views.results_events, name="results_events"),
     path("<int:question_id>/vote/", views.vote, name="vote"),
+    re_path(r"^(?P<question_id>[0-9]+)/export\.(?P<fmt>csv|ndjson)$", views.export_responses, name="export"),
     path("dashboard/", views.user_dashboard, name="dashboard"),
     path("register/", views.register, name="register"),
-    path("category/<str:category>/", views.category_view, name="category"),
+    path("category/<str:category>/", read_views.category_view, name="category"),
     path("statistics/", views.statistics_view, name="statistics"),
     
     # API endpoints
+    *async_api_urls,
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+Per-user map of the questions a user has voted on.
+
+voted_responses(user) returns {question_id: (choice_id, response_date)} for
+everything the user has answered, and voted_map(user) the same without the
+dates. It is loaded with one query and kept in the cache, so pages can show
+the user's own votes, or "voted" badges on any number of questions, without
+querying UserResponse.
+
+The cache key holds a per-user version that a committed vote bumps, rather
+than the vote being merged into the cached map: the next read reloads from
+the database, and a load that raced the commit is stored under the old
+version, where nothing reads it.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import UserResponse
+
+VOTED_KEY = 'user_votes:responses:{}:v{}'
+VERSION_KEY = 'user_votes:version:{}'
+VOTED_TIMEOUT = 60 * 60 * 24
+
+
+def _initial_version():
+    # From the clock, like cache_versions, so an evicted version isn't reused
+    return int(time.time() * 1000000)
+
+
+def voted_key(user_pk):
+    key = VERSION_KEY.format(user_pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return VOTED_KEY.format(user_pk, version)
+
+
+async def avoted_key(user_pk):
+    key = VERSION_KEY.format(user_pk)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return VOTED_KEY.format(user_pk, version)
+
+
+def _remember(user, responses):
+    # Kept on the user object for the rest of the request
+    user._polls_voted_responses = responses
+    user._polls_voted_map = {question_id: choice_id for question_id, (choice_id, _) in responses.items()}
+
+
+def voted_responses(user):
+    if not user.is_authenticated:
+        return {}
+    if getattr(user, '_polls_voted_responses', None) is None:
+        # The version is read before the query, see the module docstring
+        key = voted_key(user.pk)
+        responses = cache.get(key)
+        if responses is None:
+            responses = {
+                question_id: (choice_id, response_date) for question_id, choice_id, response_date
+                in UserResponse.objects.filter(user=user).values_list('question_id', 'choice_id', 'response_date')
+            }
+            cache.set(key, responses, VOTED_TIMEOUT)
+        _remember(user, responses)
+    return user._polls_voted_responses
+
+
+async def avoted_responses(user):
+    if not user.is_authenticated:
+        return {}
+    if getattr(user, '_polls_voted_responses', None) is None:
+        key = await avoted_key(user.pk)
+        responses = await cache.aget(key)
+        if responses is None:
+            responses = {
+                question_id: (choice_id, response_date) async for question_id, choice_id, response_date
+                in UserResponse.objects.filter(user=user).values_list('question_id', 'choice_id', 'response_date')
+            }
+            await cache.aset(key, responses, VOTED_TIMEOUT)
+        _remember(user, responses)
+    return user._polls_voted_responses
+
+
+def voted_map(user):
+    if not user.is_authenticated:
+        return {}
+    voted_responses(user)
+    return user._polls_voted_map
+
+
+async def avoted_map(user):
+    if not user.is_authenticated:
+        return {}
+    await avoted_responses(user)
+    return user._polls_voted_map
+
+
+def record(user, votes):
+    """Drop the user's cached map after {question_id: choice_id} votes commit"""
+    key = VERSION_KEY.format(user.pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+    # The copy on the user object has no dates for the new responses; a later
+    # read in this request loads them under the new version
+    user._polls_voted_responses = None
+    user._polls_voted_map = None
+
+
+def record_on_commit(user, votes):
+    transaction.on_commit(lambda: record(user, votes))
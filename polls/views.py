@@ -1,47 +1,54 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import Http404, HttpResponseRedirect, HttpResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.views import generic
 from django.utils import timezone
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError
 from django.contrib import messages
 from django.contrib.auth import login, authenticate
-from django.core.cache import cache
-from django.views.decorators.cache import cache_page
-from django.db.models import Count, F, Sum, Q
+from django.db.models import Count, Sum, Q
 from django.contrib.auth.models import User
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import io
-import base64
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-import numpy as np
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 import os
 
-from .models import Question, Choice, UserResponse, QuestionAnalytics
+from .models import Question, Choice, UserResponse
 from .forms import CustomUserCreationForm
+from . import services
+from .ratelimit import rate_limit
+from . import cache_versions, chart_renderer, charts, conditional, exports, live, read_cache, user_votes
+
+INDEX_CACHE_TIMEOUT = 60 * 5
+RESULTS_CACHE_TIMEOUT = 60 * 15
 
 # Index view to show a list of questions
 def index(request):
-    cache_key = 'latest_questions'
-    latest_question_list = cache.get(cache_key)
-    
-    if not latest_question_list:
+    latest_question_list = read_cache.get_or_compute(
+        'index:latest_questions',
         # Only get published questions
-        latest_question_list = Question.published.order_by("-pub_date")[:5]
-        cache.set(cache_key, latest_question_list, 60 * 5)  # Cache for 5 minutes
+        lambda: list(Question.published.order_by("-pub_date").values(
+            'id', 'question_text', 'category', 'pub_date'
+        )[:5]),
+        INDEX_CACHE_TIMEOUT,
+    )
     
     # Get categories, filtering out empty ones
-    categories = Question.objects.exclude(
-        Q(category__isnull=True) | Q(category='')
-    ).values('category').annotate(
-        count=Count('id')
-    ).order_by('category')
+    categories = read_cache.get_or_compute(
+        'index:category_counts',
+        lambda: list(Question.objects.exclude(
+            Q(category__isnull=True) | Q(category='')
+        ).values('category').annotate(
+            count=Count('id')
+        ).order_by('category')),
+        INDEX_CACHE_TIMEOUT,
+    )
         
+    voted = user_votes.voted_map(request.user)
     context = {
-        "latest_question_list": latest_question_list,
+        "latest_question_list": [
+            dict(question, voted=question['id'] in voted) for question in latest_question_list
+        ],
         "categories": categories,
     }
     return render(request, "polls/index.html", context)
@@ -49,27 +56,33 @@ def index(request):
 # Detail view to see a specific question and its choices
 def detail(request, question_id):
     question = get_object_or_404(Question, pk=question_id)
+    choices = list(question.choice_set.all())
     # Check if the user has already responded to this question
-    user_response = None
-    if request.user.is_authenticated:
-        try:
-            user_response = UserResponse.objects.get(
-                user=request.user, 
-                question=question
-            )
-        except UserResponse.DoesNotExist:
-            pass
+    voted_choice_id, response_date = user_votes.voted_responses(request.user).get(question.id, (None, None))
+    voted_choice = next((choice for choice in choices if choice.id == voted_choice_id), None)
     
     return render(request, "polls/detail.html", {
         "question": question,
-        "user_response": user_response
+        "choices": choices,
+        "voted_choice": voted_choice,
+        "response_date": response_date,
     })
 
-# Results view to see the results of a specific question
-@cache_page(60 * 15)  # Cache for 15 minutes
-def results(request, question_id):
-    question = get_object_or_404(Question, pk=question_id)
-    choices = list(question.choice_set.all())
+def _results_tallies(question):
+    return tally(services.apply_pending_votes(list(question.choice_set.all())))
+
+async def aresults_tallies(question_id, version):
+    """The results page's cached tallies, for async views"""
+    async def compute():
+        choices = [choice async for choice in Choice.objects.filter(question_id=question_id)]
+        return tally(await sync_to_async(services.apply_pending_votes)(choices))
+    
+    return await read_cache.aget_or_compute(
+        cache_versions.versioned_key('results', question_id, version=version), compute, RESULTS_CACHE_TIMEOUT
+    )
+
+def tally(choices):
+    """Vote counts and percentages of a question's choices, for the results page"""
     total_votes = sum(choice.votes for choice in choices)
     
     # Calculate percentages
@@ -80,70 +93,92 @@ def results(request, question_id):
         else:
             percentage = 0
         choices_with_percentage.append({
-            'choice': choice,
+            'id': choice.id,
+            'choice_text': choice.choice_text,
+            'votes': choice.votes,
             'percentage': percentage
         })
+    return {'choices_with_percentage': choices_with_percentage, 'total_votes': total_votes}
+
+# Results view to see the results of a specific question
+def results(request, question_id):
+    state = conditional.question_state(question_id)
+    if state is None:
+        raise Http404("No Question matches the given query.")
+    question, version, last_modified = state
     
-    # Generate matplotlib chart
-    chart_img = generate_results_chart(question, choices, total_votes)
+    # The page shows the user's own vote, so it is validated per user. Pending
+    # flash messages are only shown on a full render.
+    voted_choice_id = user_votes.voted_map(request.user).get(question.id)
+    etag = conditional.make_etag('results', question.id, version, request.user.pk, voted_choice_id)
+    if not len(messages.get_messages(request)):
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return conditional.set_validators(response, etag, last_modified, private=True)
+    
+    # The tallies are shared by everyone and cached per question version;
+    # only the user's own vote is looked up per request
+    tallies = read_cache.get_or_compute(
+        cache_versions.versioned_key('results', question.id),
+        lambda: _results_tallies(question),
+        RESULTS_CACHE_TIMEOUT,
+    )
     
     # Check if user has responded
-    user_response = None
-    if request.user.is_authenticated:
-        try:
-            user_response = UserResponse.objects.get(user=request.user, question=question)
-        except UserResponse.DoesNotExist:
-            pass
+    voted_choice = next(
+        (item for item in tallies['choices_with_percentage'] if item['id'] == voted_choice_id), None
+    )
     
-    return render(request, "polls/results.html", {
+    response = render(request, "polls/results.html", {
         "question": question,
-        "choices_with_percentage": choices_with_percentage,
-        "total_votes": total_votes,
-        "chart_img": chart_img,
-        "user_response": user_response
+        "choices_with_percentage": tallies['choices_with_percentage'],
+        "total_votes": tallies['total_votes'],
+        "voted_choice": voted_choice
     })
+    return conditional.set_validators(response, etag, last_modified, private=True)
 
-def generate_results_chart(question, choices, total_votes):
-    # Create figure and axis
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    # Data for plotting
-    labels = [choice.choice_text for choice in choices]
-    values = [choice.votes for choice in choices]
-    colors = plt.cm.viridis(np.linspace(0.1, 0.9, len(values)))
-    
-    # Create horizontal bar chart
-    bars = ax.barh(labels, values, color=colors)
-    
-    # Add values and percentage annotations
-    for bar in bars:
-        width = bar.get_width()
-        percentage = f'{(width/total_votes)*100:.1f}%' if total_votes > 0 else '0%'
-        ax.text(
-            width + 0.5, 
-            bar.get_y() + bar.get_height()/2, 
-            f'{int(width)} ({percentage})', 
-            va='center'
-        )
+# Results chart image, served separately so browsers and CDNs can cache it
+def results_chart(request, question_id, fmt):
+    state = conditional.question_state(question_id)
+    if state is None:
+        raise Http404("No Question matches the given query.")
+    question, version, last_modified = state
     
-    # Customize chart
-    ax.set_title(f'Results: {question.question_text}', fontsize=14, pad=20)
-    ax.set_xlabel('Number of Votes', fontsize=12)
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    plt.tight_layout()
+    etag = f'"{question.id}-{version}-{fmt}"'
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is None:
+        choices = services.apply_pending_votes(list(question.choice_set.order_by('pk')))
+        image = chart_renderer.get_chart(question, choices, fmt)
+        if image is None:
+            # Still rendering; the results page falls back to its HTML bars
+            response = HttpResponse(status=503)
+            response['Retry-After'] = '1'
+            return response
+        response = HttpResponse(image, content_type=charts.CONTENT_TYPES[fmt])
     
-    # Convert plot to base64 image for template rendering
-    buffer = io.BytesIO()
-    canvas = FigureCanvas(fig)
-    canvas.print_png(buffer)
-    plt.close(fig)
+    return conditional.set_validators(response, etag, last_modified)
+
+# Live vote counts for the results page as Server-Sent Events
+async def results_events(request, question_id):
+    if not await Question.objects.filter(pk=question_id).aexists():
+        raise Http404("No Question matches the given query.")
     
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return f'data:image/png;base64,{image_base64}'
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(live.event_stream(question_id), content_type='text/event-stream')
+    else:
+        # WSGI workers can't hold connections open, and a stream that closes
+        # is reconnected to every few seconds by each open results page.
+        # EventSource gives up for good on a 204; the page keeps the counts
+        # it was rendered with.
+        response = HttpResponse(status=204)
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 # Vote view to submit a response to a question
 @login_required
+@rate_limit('vote')
 def vote(request, question_id):
     question = get_object_or_404(Question, pk=question_id)
     try:
@@ -155,54 +190,18 @@ def vote(request, question_id):
             "polls/detail.html",
             {
                 "question": question,
+                "choices": question.choice_set.all(),
                 "error_message": "You didn't select a choice.",
             },
         )
     
-    # Use transaction to ensure data consistency
-    with transaction.atomic():
-        # Try to get existing response
-        try:
-            user_response = UserResponse.objects.get(
-                user=request.user,
-                question=question
-            )
-            # If changing vote, decrement the previous choice's votes
-            if user_response.choice != selected_choice:
-                user_response.choice.votes = F('votes') - 1
-                user_response.choice.save()
-                # Update the response to the new choice
-                user_response.choice = selected_choice
-                user_response.save()
-                
-                # Increment the selected choice's votes
-                selected_choice.votes = F('votes') + 1
-                selected_choice.save()
-                
-                messages.success(request, "Your vote has been updated!")
-            else:
-                messages.info(request, "You've already voted for this choice!")
-                
-        except UserResponse.DoesNotExist:
-            # Create new response
-            UserResponse.objects.create(
-                user=request.user,
-                question=question,
-                choice=selected_choice
-            )
-            
-            # Increment the vote count
-            selected_choice.votes = F('votes') + 1
-            selected_choice.save()
-            
-            messages.success(request, "Your vote has been recorded!")
-        
-        # Update analytics
-        analytics, created = QuestionAnalytics.objects.get_or_create(question=question)
-        analytics.update_analytics()
-        
-        # Invalidate cache for results page
-        cache.delete(f'views.decorators.cache.cache_page.{request.path}')
+    outcome = services.cast_vote(request.user, question.id, selected_choice.id)
+    if outcome == services.VOTE_CREATED:
+        messages.success(request, "Your vote has been recorded!")
+    elif outcome == services.VOTE_CHANGED:
+        messages.success(request, "Your vote has been updated!")
+    else:
+        messages.info(request, "You've already voted for this choice!")
     
     return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
 
@@ -242,7 +241,10 @@ def register(request):
 
 # Category view to filter questions by category
 def category_view(request, category):
-    questions = Question.published.filter(category=category).order_by('-pub_date')
+    questions = list(Question.published.filter(category=category).order_by('-pub_date'))
+    voted = user_votes.voted_map(request.user)
+    for question in questions:
+        question.voted = question.id in voted
     return render(request, "polls/category.html", {
         "category": category,
         "questions": questions
@@ -267,6 +269,20 @@ def statistics_view(request):
     
     return render(request, "polls/statistics.html", {"stats": stats})
 
+# Download of a poll's responses for staff, streamed as it is read
+@login_required
+def export_responses(request, question_id, fmt):
+    if not request.user.is_staff:
+        messages.error(request, "You don't have permission to access this page.")
+        return redirect("polls:index")
+    
+    question = get_object_or_404(Question, pk=question_id)
+    # Under ASGI a sync iterator would be read into memory in full before sending
+    lines = exports.astream(question.id, fmt) if isinstance(request, ASGIRequest) else exports.stream(question.id, fmt)
+    response = StreamingHttpResponse(lines, content_type=exports.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="question-{question.id}.{fmt}"'
+    return response
+
 # Add this simple view for Vercel debugging
 def vercel_landing(request):
     """Super simple view to test Vercel deployment"""
@@ -0,0 +1,215 @@
+"""
+Write-behind buffer for Choice.votes.
+
+With POLLS_VOTE_INGESTION set to 'buffered', vote increments are added to a
+counter per choice in the cache instead of updating the Choice row in the
+request. flush() coalesces the pending deltas and writes them to the database
+in a single UPDATE, either from the flush_vote_buffer Celery task or inline
+once the size or time threshold in POLLS_VOTE_BUFFER is reached.
+
+The first delta for a choice since the last flush appends the choice to a
+journal, which flush() reads in order. A journal slot that stays empty for
+JOURNAL_GRACE seconds is given up on, and that flush sweeps every choice's
+dirty marker and delta instead, so one lost entry doesn't hold back the rest.
+
+Deltas live in their own CACHE_ALIAS cache, which never culls entries: Redis
+when that is the shared tier, otherwise a per-process LocMemCache. Votes that
+haven't been flushed are lost if that cache is: when a LocMemCache process
+exits, or when Redis restarts without persistence or evicts keys (run it
+with maxmemory-policy noeviction).
+"""
+import itertools
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+
+from . import cache_versions
+from .models import Choice
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'vote_buffer'
+cache = ConnectionProxy(caches, CACHE_ALIAS)
+
+DELTA_KEY = 'vote_buffer:delta:{}'
+DIRTY_KEY = 'vote_buffer:dirty:{}'
+JOURNAL_KEY = 'vote_buffer:journal:{}'
+JOURNAL_LENGTH_KEY = 'vote_buffer:journal_length'
+FLUSHED_UPTO_KEY = 'vote_buffer:flushed_upto'
+PENDING_KEY = 'vote_buffer:pending'
+LAST_FLUSH_KEY = 'vote_buffer:last_flush'
+FLUSH_LOCK_KEY = 'vote_buffer:flush_lock'
+MISSING_KEY = 'vote_buffer:missing:{}'
+
+FLUSH_LOCK_TIMEOUT = 60
+SWEEP_CHUNK_SIZE = 1000
+
+
+def is_enabled():
+    return getattr(settings, 'POLLS_VOTE_INGESTION', 'direct') == 'buffered'
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_VOTE_BUFFER', {}).get(name, default)
+
+
+def _incr(key, delta=1):
+    """Atomically add delta to an integer cache key, creating it if needed"""
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+def _buffer(deltas):
+    for choice_id, delta in deltas.items():
+        _incr(DELTA_KEY.format(choice_id), delta)
+        # Only the first delta since the last flush puts the choice in the journal
+        if cache.add(DIRTY_KEY.format(choice_id), 1, timeout=None):
+            position = _incr(JOURNAL_LENGTH_KEY)
+            cache.set(JOURNAL_KEY.format(position), choice_id, timeout=None)
+
+
+def add_votes(deltas):
+    """
+    Add a {choice_id: delta} mapping to the buffer and flush if a threshold is hit
+    """
+    deltas = {choice_id: delta for choice_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    _buffer(deltas)
+    pending = _incr(PENDING_KEY, len(deltas))
+    if should_flush(pending):
+        flush()
+
+
+def record_votes(deltas):
+    """
+    Apply vote deltas according to POLLS_VOTE_INGESTION.
+
+    In direct mode the Choice rows are updated immediately; in buffered mode the
+    deltas go to the cache once the surrounding transaction commits.
+    """
+    if is_enabled():
+        transaction.on_commit(lambda: add_votes(deltas))
+    else:
+        Choice.objects.add_votes(deltas)
+
+
+def should_flush(pending):
+    if pending >= _option('FLUSH_THRESHOLD', 100):
+        return True
+    last_flush = cache.get(LAST_FLUSH_KEY)
+    if last_flush is None:
+        # Start the interval from the first buffered vote
+        cache.add(LAST_FLUSH_KEY, time.time(), timeout=None)
+        return False
+    return time.time() - last_flush >= _option('FLUSH_INTERVAL', 10)
+
+
+def pending_deltas(choice_ids):
+    """Return the unflushed {choice_id: delta} for the given choices"""
+    keys = {DELTA_KEY.format(choice_id): choice_id for choice_id in choice_ids}
+    found = cache.get_many(keys)
+    return {keys[key]: delta for key, delta in found.items() if delta}
+
+
+def apply_pending(choices):
+    """Add the unflushed deltas to a list of Choice instances in place"""
+    if not is_enabled():
+        return choices
+    deltas = pending_deltas([choice.pk for choice in choices])
+    for choice in choices:
+        choice.votes += deltas.get(choice.pk, 0)
+    return choices
+
+
+def _abandoned(position):
+    """Whether a journal slot has been empty for longer than JOURNAL_GRACE seconds"""
+    key = MISSING_KEY.format(position)
+    cache.add(key, time.time(), timeout=None)
+    return time.time() - cache.get(key, time.time()) >= _option('JOURNAL_GRACE', 30)
+
+
+def _sweep():
+    """Every choice with a dirty marker or a pending delta, found without the journal"""
+    found = []
+    choice_ids = Choice.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=SWEEP_CHUNK_SIZE)
+    while chunk := list(itertools.islice(choice_ids, SWEEP_CHUNK_SIZE)):
+        keys = {key.format(choice_id): choice_id for choice_id in chunk for key in (DIRTY_KEY, DELTA_KEY)}
+        found.extend(dict.fromkeys(keys[key] for key in cache.get_many(keys)))
+    return found
+
+
+def flush():
+    """
+    Write all pending deltas to Choice.votes.
+
+    Returns the number of choices updated, or None if another flush is running.
+    """
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=FLUSH_LOCK_TIMEOUT):
+        return None
+    try:
+        pending = cache.get(PENDING_KEY, 0)
+        start = cache.get(FLUSHED_UPTO_KEY, 0)
+        end = cache.get(JOURNAL_LENGTH_KEY, 0)
+        entries = cache.get_many([JOURNAL_KEY.format(p) for p in range(start + 1, end + 1)])
+
+        choice_ids = []
+        flushed_upto = start
+        lost = False
+        for position in range(start + 1, end + 1):
+            choice_id = entries.get(JOURNAL_KEY.format(position))
+            if choice_id is None:
+                if not _abandoned(position):
+                    # A writer has reserved this slot but not filled it yet
+                    break
+                # Evicted, or its writer died before filling it. Its choice is
+                # still marked dirty, so it is found by the sweep below.
+                lost = True
+            else:
+                choice_ids.append(choice_id)
+            flushed_upto = position
+        if lost:
+            choice_ids = list(dict.fromkeys(choice_ids + _sweep()))
+
+        # Clear the dirty markers first so that votes arriving from here on are
+        # journaled again and picked up by the next flush
+        cache.delete_many([DIRTY_KEY.format(choice_id) for choice_id in choice_ids])
+        deltas = {}
+        for choice_id in choice_ids:
+            key = DELTA_KEY.format(choice_id)
+            delta = cache.get(key, 0)
+            if delta:
+                # Subtract what we read rather than resetting, to keep concurrent increments
+                cache.decr(key, delta)
+                deltas[choice_id] = deltas.get(choice_id, 0) + delta
+
+        try:
+            Choice.objects.add_votes(deltas)
+        except Exception:
+            logger.exception("Failed to flush vote buffer, requeueing deltas")
+            _buffer(deltas)
+            raise
+
+        cache.delete_many([
+            key.format(p) for p in range(start + 1, flushed_upto + 1) for key in (JOURNAL_KEY, MISSING_KEY)
+        ])
+        cache.set(FLUSHED_UPTO_KEY, flushed_upto, timeout=None)
+        if pending:
+            _incr(PENDING_KEY, -pending)
+        cache.set(LAST_FLUSH_KEY, time.time(), timeout=None)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+    if deltas:
+        # Choice.votes as stored has changed, e.g. for API serializers
+        cache_versions.bump(Choice.objects.filter(pk__in=deltas).values_list('question_id', flat=True))
+        logger.info(f"Flushed vote buffer for {len(deltas)} choices")
+    return len(deltas)
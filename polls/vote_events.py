@@ -0,0 +1,108 @@
+"""
+Compaction of the append-only VoteEvent log.
+
+Every vote appends a VoteEvent. With POLLS_VOTE_INGESTION set to 'events' the
+vote path stops there and marks the event as deferred; compact() later folds
+deferred events into Choice.votes and QuestionAnalytics in chunks, keeping a
+high-water mark so each run only reads events it has not seen yet.
+"""
+import datetime
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import cache_versions
+from .models import Choice, QuestionAnalytics, VoteEvent, VoteCompactionCheckpoint
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'vote_events'
+
+
+def is_enabled():
+    return getattr(settings, 'POLLS_VOTE_INGESTION', 'direct') == 'events'
+
+
+def _option(name, default):
+    return getattr(settings, 'POLLS_VOTE_EVENTS', {}).get(name, default)
+
+
+def high_water_mark():
+    return VoteCompactionCheckpoint.objects.filter(
+        name=CHECKPOINT_NAME
+    ).values_list('last_event_id', flat=True).first() or 0
+
+
+def compact(chunk_size=None):
+    """
+    Fold new vote events into the counters and return how many were read.
+
+    Events younger than SETTLE_SECONDS, and every event after the first of
+    them, are left for the next run, so that an event whose transaction
+    commits late is not skipped by the high-water mark.
+    """
+    chunk_size = chunk_size or _option('CHUNK_SIZE', 1000)
+    cutoff = timezone.now() - datetime.timedelta(seconds=_option('SETTLE_SECONDS', 5))
+    processed = 0
+
+    while True:
+        with transaction.atomic():
+            checkpoint, created = VoteCompactionCheckpoint.objects.select_for_update().get_or_create(
+                name=CHECKPOINT_NAME
+            )
+            events = VoteEvent.objects.filter(pk__gt=checkpoint.last_event_id)
+            # Stop before the first unsettled event: the high-water mark would
+            # otherwise move past it and it would never be counted
+            unsettled = events.filter(event_date__gte=cutoff).order_by('pk').values_list('pk', flat=True).first()
+            if unsettled is not None:
+                events = events.filter(pk__lt=unsettled)
+            events = list(
+                events.order_by('pk')
+                .values_list('pk', 'question_id', 'choice_id', 'previous_choice_id', 'deferred', 'event_date')[:chunk_size]
+            )
+            if not events:
+                break
+
+            choice_deltas = Counter()
+            new_votes = Counter()
+            vote_dates = {}
+            for event_id, question_id, choice_id, previous_choice_id, deferred, event_date in events:
+                if not deferred:
+                    # Counted synchronously when the vote was cast
+                    continue
+                choice_deltas[choice_id] += 1
+                if previous_choice_id:
+                    choice_deltas[previous_choice_id] -= 1
+                    new_votes[question_id] += 0
+                else:
+                    new_votes[question_id] += 1
+                vote_dates[question_id] = event_date
+
+            Choice.objects.add_votes(dict(choice_deltas))
+            QuestionAnalytics.objects.record_votes(dict(new_votes), vote_dates=vote_dates)
+            checkpoint.last_event_id = events[-1][0]
+            checkpoint.save(update_fields=['last_event_id'])
+            cache_versions.bump_on_change(new_votes)
+
+        processed += len(events)
+        if len(events) < chunk_size:
+            break
+
+    if processed:
+        logger.info(f"Compacted {processed} vote events")
+    return processed
+
+
+def pending_deltas(choice_ids):
+    """Return the {choice_id: delta} of deferred events not yet compacted"""
+    pending = VoteEvent.objects.filter(pk__gt=high_water_mark(), deferred=True)
+    deltas = Counter()
+    for row in pending.filter(choice_id__in=choice_ids).values('choice_id').annotate(count=Count('id')):
+        deltas[row['choice_id']] += row['count']
+    for row in pending.filter(previous_choice_id__in=choice_ids).values('previous_choice_id').annotate(count=Count('id')):
+        deltas[row['previous_choice_id']] -= row['count']
+    return {choice_id: delta for choice_id, delta in deltas.items() if delta}